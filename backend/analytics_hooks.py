@@ -4,14 +4,39 @@ Auto-log model performance, brain interventions, and comparisons
 during live Captain conversations.
 """
 
-import json, time, logging
-from datetime import datetime
+import time, logging
+import orjson
+import logging.handlers
+import atexit, queue, threading
 from foundational_config import ask_gemini, query_proprietary_data
-from model_judge_framework import _semantic_overlap, _estimate_factual_score, _estimate_reasoning_score
+from model_judge_framework import (
+    LOG_FILE as JUDGE_LOG, _semantic_overlap, _estimate_factual_score, _estimate_reasoning_score, _record_stats,
+)
 
-# Configure main trace log
-logging.basicConfig(filename="brain_trace.log", level=logging.INFO, format="%(asctime)s - %(message)s")
-JUDGE_LOG = "model_judge_log.json"
+BRAIN_LOG = "brain_trace.log"
+
+# Group commit for the judge log: records are queued and flushed in batches
+_FLUSH_BATCH = 64
+_FLUSH_INTERVAL = 0.25  # seconds
+_JUDGE_QUEUE = queue.Queue()
+_FLUSHER_LOCK = threading.Lock()
+_flusher_started = False
+
+_LOGGER = logging.getLogger("brain")
+logger = logging.getLogger(__name__)
+
+
+def _brain_logger():
+    """Attach the rotating trace-log handler on first use (no import-time I/O)."""
+    if not _LOGGER.handlers:
+        handler = logging.handlers.RotatingFileHandler(
+            BRAIN_LOG, maxBytes=4 << 20, backupCount=5, encoding="utf-8", delay=True
+        )
+        handler.setFormatter(logging.Formatter("%(asctime)s - %(message)s"))
+        _LOGGER.addHandler(handler)
+        _LOGGER.setLevel(logging.INFO)
+        _LOGGER.propagate = False
+    return _LOGGER
 
 
 # ---------------------------------------------------------------
@@ -24,7 +49,7 @@ def log_brain_intervention(context, query, response):
         f"Query: {query}\n"
         f"Response: {response[:250]}...\n{'-'*60}\n"
     )
-    logging.info(entry)
+    _brain_logger().info(entry)
 
 
 # ---------------------------------------------------------------
@@ -32,27 +57,89 @@ def log_brain_intervention(context, query, response):
 # ---------------------------------------------------------------
 def log_comparison(query, dataset, agentic_text, gemini_text, start_time):
     duration = round(time.time() - start_time, 2)
+    factual = _estimate_factual_score(agentic_text)
+    reasoning = _estimate_reasoning_score(gemini_text)
     result = {
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "ts_ns": time.time_ns(),
         "query": query,
         "dataset": dataset,
         "agentic_answer": agentic_text,
         "general_answer": gemini_text,
         "semantic_overlap": _semantic_overlap(agentic_text, gemini_text),
-        "factual_score": _estimate_factual_score(agentic_text),
-        "reasoning_score": _estimate_reasoning_score(gemini_text),
+        "factual_score": factual,
+        "reasoning_score": reasoning,
         "response_time_sec": duration,
         "final_verdict": (
-            "🧠 Gemini" if _estimate_reasoning_score(gemini_text) > _estimate_factual_score(agentic_text)
+            "🧠 Gemini" if reasoning > factual
             else "🏢 Agentic (RAG)"
         )
     }
 
-    # Append to JSON log
-    if not os.path.exists(JUDGE_LOG):
-        with open(JUDGE_LOG, "w") as f: json.dump([], f)
-    with open(JUDGE_LOG, "r") as f: data = json.load(f)
-    data.append(result)
-    with open(JUDGE_LOG, "w") as f: json.dump(data, f, indent=2)
+    # Count it in the judge summary, then hand the record to the background
+    # flusher; no disk I/O on the reply path
+    _record_stats(result)
+    _start_flusher()
+    _JUDGE_QUEUE.put(result)
 
     return result
+
+
+def _write_batch(batch):
+    """Append a batch of records to the JSONL log with a single write()."""
+    with open(JUDGE_LOG, "ab", buffering=1 << 16) as f:
+        f.write(b"".join(orjson.dumps(r, option=orjson.OPT_APPEND_NEWLINE) for r in batch))
+
+
+def _flusher():
+    while True:
+        batch = [_JUDGE_QUEUE.get()]
+        deadline = time.monotonic() + _FLUSH_INTERVAL
+        while len(batch) < _FLUSH_BATCH:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_JUDGE_QUEUE.get(timeout=remaining))
+            except queue.Empty:
+                break
+        try:
+            _write_batch(batch)
+        except Exception as e:
+            logger.warning("⚠️ Judge log flush failed: %s", e)
+
+
+def _start_flusher():
+    global _flusher_started
+    if _flusher_started:
+        return
+    with _FLUSHER_LOCK:
+        if not _flusher_started:
+            threading.Thread(target=_flusher, name="judge-log-flusher", daemon=True).start()
+            _flusher_started = True
+
+
+def flush_judge_log():
+    """Synchronously write any records still waiting in the queue."""
+    batch = []
+    while True:
+        try:
+            batch.append(_JUDGE_QUEUE.get_nowait())
+        except queue.Empty:
+            break
+    if batch:
+        _write_batch(batch)
+
+
+atexit.register(flush_judge_log)
+
+
+def read_judge_log():
+    """Lazily yield parsed comparison records from the JSONL log."""
+    flush_judge_log()
+    try:
+        with open(JUDGE_LOG, "rb") as f:
+            for line in f:
+                if line.strip():
+                    yield orjson.loads(line)
+    except FileNotFoundError:
+        return
@@ -0,0 +1,18 @@
+"""
+ASGI entry point for production serving.
+
+Runs the Flask app under an ASGI server with a large worker-thread pool, so
+requests blocked on Gemini, RAG retrieval, PDF parsing or Firebase overlap
+instead of queuing behind a handful of threads:
+
+    cd backend && uvicorn asgi:app --workers 4 --port 5000
+"""
+
+import os
+from a2wsgi import WSGIMiddleware
+from main import app as flask_app
+
+# In-flight requests per process; the views are I/O-bound, so this can be high
+ASGI_THREADS = int(os.getenv("ASGI_THREADS", "256"))
+
+app = WSGIMiddleware(flask_app, workers=ASGI_THREADS)
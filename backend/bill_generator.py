@@ -1,14 +1,21 @@
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
+from io import BytesIO
 import os
 import datetime
 
+FILE_STAMP_FORMAT = "%Y%m%d_%H%M%S"
+DATE_FORMAT = "%d-%m-%Y"
+
 def create_bill_pdf(data):
     os.makedirs("generated_bills", exist_ok=True)
-    file_name = f"Bill_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+    now = datetime.datetime.now()
+    file_name = f"Bill_{now.strftime(FILE_STAMP_FORMAT)}.pdf"
     file_path = os.path.join("generated_bills", file_name)
 
-    c = canvas.Canvas(file_path, pagesize=A4)
+    # Render in memory, then write the finished PDF to disk in one call
+    buf = BytesIO()
+    c = canvas.Canvas(buf, pagesize=A4)
     width, height = A4
 
     c.setFont("Helvetica-Bold", 16)
@@ -16,7 +23,7 @@ def create_bill_pdf(data):
 
     c.setFont("Helvetica", 12)
     c.drawString(50, height - 80, f"Company: {data.get('company_name', 'N/A')}")
-    c.drawString(50, height - 100, f"Date: {datetime.datetime.now().strftime('%d-%m-%Y')}")
+    c.drawString(50, height - 100, f"Date: {now.strftime(DATE_FORMAT)}")
 
     c.line(50, height - 110, width - 50, height - 110)
     y = height - 140
@@ -39,4 +46,7 @@ def create_bill_pdf(data):
     c.drawString(50, y, f"Total: ₹{data.get('total_amount', 0)}")
 
     c.save()
+    pdf_bytes = buf.getvalue()
+    with open(file_path, "wb") as f:
+        f.write(pdf_bytes)
     return file_path
@@ -1,10 +1,10 @@
 import json
 import re
+import orjson
 import os
-from datetime import datetime
 from fpdf import FPDF
 from rate import estimate_rate
-from firebase_db import get_state, store_state, append_message, get_messages
+from firebase_db import get_state, commit_turn, append_message, get_recent_messages, next_order_sequence
 from foundational_config import ask_gemini
 
 class NitisaraCaptain:
@@ -15,8 +15,7 @@ class NitisaraCaptain:
     - Refuses to answer general trivia or off-topic questions.
     """
 
-    def __init__(self):
-        self.system_prompt = """
+    system_prompt = """
         You are Captain, a senior logistics consultant for NITISARA.
         
         CORE PROTOCOL:
@@ -33,10 +32,20 @@ class NitisaraCaptain:
         """
 
     def process_conversation(self, user, message):
-        # 1. Save User Message
-        append_message(user, "user", message)
+        try:
+            state, final_response = self._run_turn(user, message)
+        except Exception:
+            # The turn never reached its write; still keep what the user said
+            append_message(user, "user", message)
+            raise
+
+        # 4. Persist state and both messages in one write, then return
+        commit_turn(user, state, [("user", message), ("captain", final_response)])
+        return final_response
 
-        # 2. Get Context
+    def _run_turn(self, user, message):
+        """Decide and execute one turn; returns (new state, reply) without persisting either."""
+        # 1. Get Context
         state = get_state(user)
         if not state or "booking_data" not in state:
             state = {
@@ -50,12 +59,12 @@ class NitisaraCaptain:
                 }
             }
         
-        history_text = self._format_history(get_messages(user))
+        history_text = self._format_history(get_recent_messages(user))
 
-        # 3. THE LLM BRAIN - Decides Action & Content
+        # 2. THE LLM BRAIN - Decides Action & Content
         decision = self._decide_action_with_llm(message, state["booking_data"], history_text)
 
-        # 4. Execute Logic based on LLM Decision
+        # 3. Execute Logic based on LLM Decision
         action = decision.get("action")
         reply_text = decision.get("reply")
         data_updates = decision.get("extracted_data", {})
@@ -67,7 +76,6 @@ class NitisaraCaptain:
                 current_data[k] = v
                 
         state["booking_data"] = current_data
-        store_state(user, state)
 
         # --- ACTION HANDLERS ---
         
@@ -78,10 +86,9 @@ class NitisaraCaptain:
             
             quote_details = self._calculate_quote(current_data)
             final_response = f"{reply_text}\n\n{quote_details}\n\n**Would you like to confirm this booking?**"
-            store_state(user, state)
 
         elif action == "CONFIRM_BOOKING":
-            order_id = f"NTS-{abs(hash(user + datetime.now().isoformat())) % 10000:04d}"
+            order_id = f"NTS-{next_order_sequence():08d}"
             bill_url = self._generate_bill_pdf(current_data, order_id)
             
             final_response = (
@@ -90,19 +97,19 @@ class NitisaraCaptain:
                 f"📄 **[Download Bill of Lading]({bill_url})**\n\n"
                 f"{reply_text}"
             )
-            store_state(user, {"step": "conversation", "booking_data": {}})
+            state["step"] = "conversation"
+            state["booking_data"] = {}
 
         elif action == "CANCEL_BOOKING":
-             store_state(user, {"step": "conversation", "booking_data": {}})
-             final_response = reply_text
+            state["step"] = "conversation"
+            state["booking_data"] = {}
+            final_response = reply_text
 
         else:
             # "INFO", "ASK_DETAILS", "GENERAL_QUERY", "DECLINE"
             final_response = reply_text
 
-        # 5. Save & Return Response
-        append_message(user, "captain", final_response)
-        return final_response
+        return state, final_response
 
     def _decide_action_with_llm(self, message, current_data, history_text):
         """
@@ -174,17 +181,13 @@ class NitisaraCaptain:
         try:
             start = text.find("{")
             end = text.rfind("}") + 1
-            return json.loads(text[start:end])
+            return orjson.loads(text[start:end])
         except:
             return {"action": "GENERAL_QUERY", "reply": "I understood, but had a system error. Please try again."}
 
-    def _format_history(self, raw_history):
-        if not raw_history: return "No history."
-        sorted_msgs = sorted(raw_history.items(), key=lambda x: int(x[0]) if x[0].isdigit() else 0)
-        lines = []
-        for _, msg in sorted_msgs[-6:]:
-            lines.append(f"{msg['role'].upper()}: {msg['content']}")
-        return "\n".join(lines)
+    def _format_history(self, recent_msgs):
+        if not recent_msgs: return "No history."
+        return "\n".join(f"{msg['role'].upper()}: {msg['content']}" for msg in recent_msgs)
 
     def _generate_bill_pdf(self, data, order_id):
         folder = os.path.join(os.getcwd(), "static", "bills")
@@ -207,9 +210,13 @@ class NitisaraCaptain:
         pdf.cell(200, 10, txt=f"Cargo: {c_desc}", ln=True)
         pdf.cell(200, 10, txt=f"Total Weight: {w_val} kg", ln=True)
         
-        pdf.output(filepath)
+        # fpdf2 returns the document bytes when no file name is given
+        with open(filepath, "wb") as f:
+            f.write(pdf.output())
         return f"http://127.0.0.1:5000/static/bills/{filename}"
 
+# Single shared Captain instance (stateless between requests)
+_CAPTAIN = NitisaraCaptain()
+
 def captain_conversation(user, message):
-    captain = NitisaraCaptain()
-    return captain.process_conversation(user, message)
\ No newline at end of file
+    return _CAPTAIN.process_conversation(user, message)
@@ -1,5 +1,43 @@
 import re
 import os
+from functools import lru_cache
+
+# Product-type, flag and HS-code keywords, matched in a single scan of the cargo text
+_PRODUCT_TYPES = [  # checked in priority order
+    (frozenset({"chemical", "acid", "paint", "hazard"}), "chemical"),
+    (frozenset({"food", "snack", "spice", "beverage"}), "food"),
+    (frozenset({"electronic", "mobile", "computer", "device"}), "electronics"),
+    (frozenset({"steel", "metal", "copper", "wire"}), "metal"),
+]
+_HAZARD_WORDS = frozenset({"chemical", "acid", "hazard", "explosive", "flammable"})
+_FRAGILE_WORDS = frozenset({"glass", "fragile", "electronic", "delicate"})
+_RESTRICTED_WORDS = frozenset({"weapon", "ivory", "endangered", "narcotic"})
+_HS_CODES = [
+    (frozenset({"copper"}), "7408.19.00"),  # Copper wire
+    (frozenset({"steel"}), "7326.90.90"),
+    (frozenset({"textile", "fabric"}), "6203.42.00"),
+    (frozenset({"food", "spice"}), "2106.90.00"),
+    (frozenset({"chemical"}), "3822.00.00"),
+    (frozenset({"electronic", "mobile"}), "8517.12.00"),
+]
+_KEYWORDS_RE = re.compile("|".join(sorted(
+    _HAZARD_WORDS | _FRAGILE_WORDS | _RESTRICTED_WORDS
+    | frozenset().union(*(w for w, _ in _PRODUCT_TYPES), *(w for w, _ in _HS_CODES)),
+    key=len, reverse=True,
+)))
+
+_TRADE_GUIDANCE = (
+    "\n🌍 Trade Guidance:",
+    "• Verify destination import restrictions.",
+    "• Ensure packaging and labeling meet IMO standards.",
+    "• Validate insurance coverage and customs docs.",
+)
+
+
+def _keywords(text):
+    """Return the set of known keywords occurring anywhere in `text`."""
+    return set(_KEYWORDS_RE.findall(text))
+
 
 def check_compliance(product, docs=None):
     """
@@ -14,43 +52,36 @@ def check_compliance(product, docs=None):
         return _analyze_document_compliance(product)
 
     # Otherwise treat it as a text description (like “2 pallets, 600 kg”)
-    return _analyze_compliance(product, docs)
+    # Normalized, hashable arguments so repeated cargo strings hit the cache
+    return _analyze_compliance(str(product or "").lower(), tuple(sorted(docs)))
 
 
 def _analyze_document_compliance(file_path):
     """Mock document-based compliance for uploaded files."""
     try:
         import fitz  # PyMuPDF
-        text = ""
+        # Only the length is reported, so pages are counted one at a time, never joined
         with fitz.open(file_path) as pdf:
-            for page in pdf:
-                text += page.get_text("text")
-        return f"📄 Compliance Check (Document Mode): Successfully parsed {len(text)} characters from PDF."
+            chars = sum(len(page.get_text("text")) for page in pdf)
+        return f"📄 Compliance Check (Document Mode): Successfully parsed {chars} characters from PDF."
     except Exception as e:
         return f"⚠️ Document compliance scan failed: {str(e)}"
 
 
+@lru_cache(maxsize=1024)
 def _analyze_compliance(product, docs):
-    """Analyze compliance requirements based on cargo/product text."""
+    """Analyze compliance requirements based on cargo/product text (docs as a tuple)."""
     product = str(product or "").lower()
-    docs = docs or []
-
-    # Extract keywords to detect type
-    if re.search(r'chemical|acid|paint|hazard', product):
-        product_type = "chemical"
-    elif re.search(r'food|snack|spice|beverage', product):
-        product_type = "food"
-    elif re.search(r'electronic|mobile|computer|device', product):
-        product_type = "electronics"
-    elif re.search(r'steel|metal|copper|wire', product):
-        product_type = "metal"
-    else:
-        product_type = "general cargo"
+    docs = docs or ()
+
+    # Extract keywords once; type and hazard flags are set lookups on them
+    found = _keywords(product)
+    product_type = next((ptype for words, ptype in _PRODUCT_TYPES if found & words), "general cargo")
 
     # Hazard detection
-    hazardous = bool(re.search(r'chemical|acid|hazard|explosive|flammable', product))
-    fragile = bool(re.search(r'glass|fragile|electronic|delicate', product))
-    restricted = bool(re.search(r'weapon|ivory|endangered|narcotic', product))
+    hazardous = bool(found & _HAZARD_WORDS)
+    fragile = bool(found & _FRAGILE_WORDS)
+    restricted = bool(found & _RESTRICTED_WORDS)
 
     # Standard docs
     standard_docs = ["Commercial Invoice", "Packing List", "Bill of Lading", "Certificate of Origin"]
@@ -59,46 +90,30 @@ def _analyze_compliance(product, docs):
 
     # Core compliance output
     status = "✅ COMPLIANCE VERIFIED" if not missing and not hazardous and not restricted else "⚠️ COMPLIANCE ATTENTION REQUIRED"
-    result = [f"{status}\n"]
-
-    # Append analysis
-    result.append(f"🧾 Product Type: {product_type.title()}")
-    result.append(f"• Hazardous: {'Yes ❌' if hazardous else 'No ✅'}")
-    result.append(f"• Fragile: {'Yes ⚠️' if fragile else 'No ✅'}")
-    result.append(f"• Restricted: {'Yes ❌' if restricted else 'No ✅'}")
+    result = [
+        f"{status}\n",
+        f"🧾 Product Type: {product_type.title()}",
+        f"• Hazardous: {'Yes ❌' if hazardous else 'No ✅'}",
+        f"• Fragile: {'Yes ⚠️' if fragile else 'No ✅'}",
+        f"• Restricted: {'Yes ❌' if restricted else 'No ✅'}",
+    ]
 
     if missing:
         result.append("\n📄 Missing Required Documents:")
-        for doc in missing:
-            result.append(f"• {doc}")
-
-    # HS code suggestion
-    hs_code = _suggest_hs_code(product)
-    result.append(f"\n📋 Suggested HS Code: {hs_code}")
+        result.extend(f"• {doc}" for doc in missing)
 
-    # Final compliance note
-    result.append("\n🌍 Trade Guidance:")
-    result.append("• Verify destination import restrictions.")
-    result.append("• Ensure packaging and labeling meet IMO standards.")
-    result.append("• Validate insurance coverage and customs docs.")
+    # HS code suggestion + final compliance note
+    result.append(f"\n📋 Suggested HS Code: {_suggest_hs_code(product)}")
+    result.extend(_TRADE_GUIDANCE)
 
     return "\n".join(result)
 
 
+@lru_cache(maxsize=256)
 def _suggest_hs_code(product):
     """Suggest HS code intelligently based on text."""
-    p = product.lower()
-    if "copper" in p:
-        return "7408.19.00"  # Copper wire
-    if "steel" in p:
-        return "7326.90.90"
-    if "textile" in p or "fabric" in p:
-        return "6203.42.00"
-    if "food" in p or "spice" in p:
-        return "2106.90.00"
-    if "chemical" in p:
-        return "3822.00.00"
-    if "electronic" in p or "mobile" in p:
-        return "8517.12.00"
+    found = _keywords(product.lower())
+    for keywords, code in _HS_CODES:
+        if found & keywords:
+            return code
     return "9999.99.99"
- 
\ No newline at end of file
@@ -1,5 +1,5 @@
-from .extract_text import extract_text_from_pdf
-from .verify_details import extract_key_fields, verify_with_backend
+from .extract_text import iter_pdf_pages
+from .verify_details import extract_key_fields_from_pages, verify_with_backend
 
 def check_compliance(file_path):
     """
@@ -7,8 +7,7 @@ def check_compliance(file_path):
     and verifies them with backend rules.
     """
     try:
-        text = extract_text_from_pdf(file_path)
-        key_fields = extract_key_fields(text)
+        text, key_fields = extract_key_fields_from_pages(iter_pdf_pages(file_path), min_chars=500)
         verification = verify_with_backend(key_fields)
         
         return {
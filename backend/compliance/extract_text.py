@@ -1,12 +1,21 @@
 import fitz  # PyMuPDF
 
-def extract_text_from_pdf(file_path: str) -> str:
-    """Extract all text from a PDF document."""
+def _open_pdf(source):
+    """Open a PDF from a file path or from in-memory bytes."""
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+
+def iter_pdf_pages(file_path):
+    """Yield the text of each PDF page in order, so callers can stop early.
+    `file_path` may also be the PDF's bytes."""
     try:
-        text = ""
-        with fitz.open(file_path) as pdf:
+        with _open_pdf(file_path) as pdf:
             for page in pdf:
-                text += page.get_text("text")
-        return text.strip()
+                yield page.get_text("text")
     except Exception as e:
         raise RuntimeError(f"PDF text extraction failed: {e}")
+
+def extract_text_from_pdf(file_path: str) -> str:
+    """Extract all text from a PDF document."""
+    return "".join(iter_pdf_pages(file_path)).strip()
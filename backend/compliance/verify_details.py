@@ -1,18 +1,90 @@
 import re
+import threading
+
+try:
+    import hyperscan  # optional: one SIMD pass finds every field label
+except ImportError:
+    hyperscan = None
+
+# Simple regex patterns (can be improved later), compiled once at import
+_HSN_RE = re.compile(r"H\.?S\.?N\.?\s*Code[:\-]?\s*([0-9]{4,8})", re.IGNORECASE)
+_PRODUCT_RE = re.compile(r"Product\s*[:\-]?\s*([\w\s]+)", re.IGNORECASE)
+_WEIGHT_RE = re.compile(r"Weight\s*[:\-]?\s*([\d\.]+\s*\w*)", re.IGNORECASE)
+
+_FIELD_PATTERNS = (("product_name", _PRODUCT_RE), ("hsn_code", _HSN_RE), ("weight", _WEIGHT_RE))
+
+# Literal label prefixes, one per field, that every full match starts with
+_LABEL_PREFIXES = (rb"Product", rb"H\.?S\.?N", rb"Weight")
+
+_HS_DB = None
+_HS_LOCAL = threading.local()  # hyperscan scratch space is per thread
+if hyperscan is not None:
+    _HS_DB = hyperscan.Database()
+    _HS_DB.compile(
+        expressions=list(_LABEL_PREFIXES),
+        ids=list(range(len(_LABEL_PREFIXES))),
+        elements=len(_LABEL_PREFIXES),
+        flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SOM_LEFTMOST] * len(_LABEL_PREFIXES),
+    )
+
+def _label_starts(text):
+    """Start offsets of each field's label, found in a single hyperscan pass."""
+    scratch = getattr(_HS_LOCAL, "scratch", None)
+    if scratch is None:
+        scratch = _HS_LOCAL.scratch = hyperscan.Scratch(_HS_DB)
+    starts = [[] for _ in _FIELD_PATTERNS]
+
+    def on_match(idx, start, end, flags, context):
+        starts[idx].append(start)
+
+    _HS_DB.scan(text.encode("ascii"), match_event_handler=on_match, scratch=scratch)
+    return starts
+
+def _search_fields(text):
+    # Byte offsets equal str offsets only for ASCII; Unicode text keeps plain re
+    if _HS_DB is None or not text.isascii():
+        return {key: pattern.search(text) for key, pattern in _FIELD_PATTERNS}
+    # Same result as pattern.search: the first label position where the full pattern matches
+    matches = {}
+    for (key, pattern), starts in zip(_FIELD_PATTERNS, _label_starts(text)):
+        matches[key] = next(filter(None, (pattern.match(text, pos) for pos in sorted(starts))), None)
+    return matches
+
+def _fields_from_matches(matches):
+    return {key: m.group(1).strip() if m else "N/A" for key, m in matches.items()}
 
 def extract_key_fields(text: str):
     """Extract key compliance details such as product, HSN, cargo, etc."""
-    data = {}
+    return _fields_from_matches(_search_fields(text))
 
-    # Simple regex patterns (can be improved later)
-    hsn_match = re.search(r"H\.?S\.?N\.?\s*Code[:\-]?\s*([0-9]{4,8})", text, re.IGNORECASE)
-    product_match = re.search(r"Product\s*[:\-]?\s*([\w\s]+)", text, re.IGNORECASE)
-    weight_match = re.search(r"Weight\s*[:\-]?\s*([\d\.]+\s*\w*)", text, re.IGNORECASE)
+def _settled(match, previous, boundary):
+    """A match is final once the last page left it unchanged and it ends before that page."""
+    if match is None or previous is None:
+        return False
+    return match.span() == previous.span() and match.end() < boundary
 
-    data["product_name"] = product_match.group(1).strip() if product_match else "N/A"
-    data["hsn_code"] = hsn_match.group(1).strip() if hsn_match else "N/A"
-    data["weight"] = weight_match.group(1).strip() if weight_match else "N/A"
-    return data
+def extract_key_fields_from_pages(pages, min_chars=0):
+    """
+    Extract key fields from page texts, reading only as many pages as needed.
+    Stops once at least `min_chars` characters have been read and the last page
+    added text but changed no field's match, every match ending before that
+    page's text (so later pages cannot change them either). Returns (text read, fields).
+    """
+    text = ""
+    body = ""
+    matches = _search_fields(body)
+    for page in pages:
+        boundary = len(body)  # end of the text read before this page
+        previous = matches
+        text += page
+        body = text.rstrip()  # trailing whitespace is stripped from the full text too
+        matches = _search_fields(body)
+        # A whitespace-only page leaves the body as it was, so it proves nothing
+        if len(body) > boundary and len(body.lstrip()) >= min_chars and all(
+            _settled(m, previous[key], boundary) for key, m in matches.items()
+        ):
+            break
+    return text.strip(), _fields_from_matches(matches)
 
 def verify_with_backend(fields):
     """
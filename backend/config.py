@@ -1,13 +1,27 @@
 import os
-from dotenv import load_dotenv
+from functools import lru_cache
+
+# Variables this app reads; when the process already has all of them set
+# (containers/prod) the .env parse is skipped. Set LOAD_DOTENV=0 to disable it.
+_ENV_KEYS = ("GEMINI_API_KEY", "GOOGLE_API_KEY", "FIREBASE_DB_URL", "FIREBASE_CREDENTIALS")
 
 # Try to load .env file, but don't fail if it doesn't exist
-try:
-    load_dotenv()
-except:
-    pass
+if os.getenv("LOAD_DOTENV", "1") == "1" and not all(k in os.environ for k in _ENV_KEYS):
+    try:
+        from dotenv import load_dotenv
+        load_dotenv(override=False)
+    except:
+        pass
+
+
+@lru_cache(maxsize=None)
+def _env(name, default=None):
+    """Cached os.getenv for runtime lookups."""
+    return os.getenv(name, default)
+
 
 # Use environment variables with fallback defaults for demo mode
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "demo_key")
-FIREBASE_DB_URL = os.getenv("FIREBASE_DB_URL", "https://demo-project-default-rtdb.firebaseio.com/")
-FIREBASE_CREDENTIALS = os.getenv("FIREBASE_CREDENTIALS", "backend/firebase-adminsdk.json")
+GEMINI_API_KEY = _env("GEMINI_API_KEY", "demo_key")
+GOOGLE_API_KEY = _env("GOOGLE_API_KEY")
+FIREBASE_DB_URL = _env("FIREBASE_DB_URL", "https://demo-project-default-rtdb.firebaseio.com/")
+FIREBASE_CREDENTIALS = _env("FIREBASE_CREDENTIALS", "backend/firebase-adminsdk.json")
@@ -0,0 +1,36 @@
+"""
+NITISARA Shared Embedder
+One MiniLM sentence-transformer per process, used by rag_system's dense
+retrieval and by the FAISS stores in foundational_config
+"""
+
+import logging
+import threading
+from typing import List
+import numpy as np
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+logger = logging.getLogger(__name__)
+
+_EMBEDDER = None
+_EMBEDDER_FAILED = False
+_EMBEDDER_LOCK = threading.Lock()
+
+def get_embedder():
+    """Load the sentence-transformer once; None if it is unavailable"""
+    global _EMBEDDER, _EMBEDDER_FAILED
+    if _EMBEDDER is None and not _EMBEDDER_FAILED:
+        with _EMBEDDER_LOCK:
+            if _EMBEDDER is None and not _EMBEDDER_FAILED:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                    _EMBEDDER = SentenceTransformer(EMBEDDING_MODEL)
+                except Exception as e:
+                    _EMBEDDER_FAILED = True
+                    logger.warning("MiniLM embedding model unavailable: %s", e)
+    return _EMBEDDER
+
+def embed(embedder, texts: List[str]) -> np.ndarray:
+    """Unit-length float32 embeddings, so inner product is cosine similarity"""
+    return np.asarray(embedder.encode(texts, normalize_embeddings=True), dtype=np.float32)
@@ -4,11 +4,58 @@ Implements AI Evals, LLM-as-Judge, and A/B Testing for Captain Agent
 """
 
 import json
+import atexit
+import logging
+import re
 import time
-from typing import Dict, List, Any
-from dataclasses import dataclass
+import queue
+import threading
+from collections import deque
+from uuid import uuid4
+from typing import Dict, List, Any, Set, Optional
+from dataclasses import dataclass, field
+from concurrent.futures import Future, ThreadPoolExecutor
 from gemini_chain import get_llm_response
 
+logger = logging.getLogger(__name__)
+
+# LLM-as-Judge calls run here so evaluation never blocks on the network
+_JUDGE_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="llm-judge")
+
+# Most recent results kept in memory; summaries come from running totals
+HISTORY_LIMIT = 256
+
+# Every scored result is appended to this JSONL log in batches
+EVAL_LOG = "evaluations.jsonl"
+EVAL_FLUSH_BATCH = 1024
+EVAL_FLUSH_INTERVAL = 5.0  # seconds
+_METRIC_NAMES = ('response_time', 'accuracy', 'user_satisfaction', 'compliance_accuracy', 'rate_accuracy')
+
+# Judge-response score pattern: an explicit overall score, or any bare number
+_JUDGE_SCORE_RE = re.compile(r'overall score[:\s]*(?P<overall>\d+(?:\.\d+)?)|\b(?P<num>\d+(?:\.\d+)?)\b')
+
+# Response keywords by category, found together in one scan of the lowercased text
+_COMPLIANCE_KEYWORDS = frozenset({'compliance', 'document', 'certificate', 'hs code', 'trade'})
+_RATE_KEYWORDS = frozenset({'rate', 'price', 'cost', '₹', 'inr', 'usd'})
+_CO2_KEYWORDS = frozenset({'co₂e', 'carbon'})
+# User-input words that decide which category checks run
+_COMPLIANCE_TRIGGERS = frozenset({'compliance', 'document'})
+_RATE_TRIGGERS = frozenset({'rate', 'price', 'cost'})
+_ALL_KEYWORDS = _COMPLIANCE_KEYWORDS | _RATE_KEYWORDS | _CO2_KEYWORDS | {'sea', 'air'}
+# Zero-width lookahead reports overlapping hits too (e.g. 'rate' inside 'trade')
+_KEYWORD_SCAN_RE = re.compile(
+    '(?=(' + '|'.join(re.escape(k) for k in sorted(_ALL_KEYWORDS, key=len, reverse=True)) + '))'
+)
+# Unprofessional words match whole words only ('damn' must not fire inside 'amsterdam');
+# professional ones keep prefix matching so 'recommended' or 'suggestions' still count
+_UNPROF_RE = re.compile(r'\b(?:damn|crap|stupid|idiot)\b')
+_PROF_RE = re.compile(r'\b(?:thank you|please|recommend|suggest)')
+
+
+def _keyword_hits(text_lower: str) -> Set[str]:
+    """Return every known keyword occurring as a substring of `text_lower`."""
+    return set(_KEYWORD_SCAN_RE.findall(text_lower))
+
 @dataclass
 class EvaluationResult:
     """Structure for evaluation results"""
@@ -17,54 +64,136 @@ class EvaluationResult:
     user_input: str
     agent_response: str
     metrics: Dict[str, float]
-    llm_judge_score: float
+    llm_judge_score: Optional[float] = None  # filled in once the judge finishes
     human_feedback: str = ""
+    llm_judge_future: Optional[Future] = field(default=None, repr=False, compare=False)
+
+    def wait_for_judge(self, timeout: float = None) -> Optional[float]:
+        """Block until the background LLM judge has scored this result"""
+        if self.llm_judge_future is not None:
+            self.llm_judge_future.result(timeout)
+        return self.llm_judge_score
 
 class NitisaraEvaluator:
     """NITISARA AI Evaluation Framework"""
     
     def __init__(self):
-        self.evaluation_history = []
-        self.performance_metrics = {
-            'response_time': [],
-            'accuracy': [],
-            'user_satisfaction': [],
-            'compliance_accuracy': [],
-            'rate_accuracy': []
-        }
+        self.evaluation_history = deque(maxlen=HISTORY_LIMIT)
+        self.total_evaluations = 0
+        # Running (sum, count) per metric
+        self._metric_sums = dict.fromkeys(_METRIC_NAMES, 0.0)
+        self._metric_counts = dict.fromkeys(_METRIC_NAMES, 0)
+        # Request and judge threads only enqueue; one aggregator thread owns
+        # the history and the running totals, so neither needs a lock (readers
+        # see the totals as of the last aggregated event)
+        self._events = queue.SimpleQueue()
+        self._aggregator_lock = threading.Lock()
+        self._aggregator_started = False
+        # Scored results waiting to be appended to EVAL_LOG
+        self._pending_log = []
+        self._last_flush = time.monotonic()
+        self._log_lock = threading.Lock()
+    
+    def _record_metric(self, metric: str, value: float):
+        """Add one observation to the running totals for `metric` (aggregator thread)"""
+        self._metric_sums[metric] += value
+        self._metric_counts[metric] += 1
+    
+    def _enqueue(self, event):
+        if not self._aggregator_started:
+            with self._aggregator_lock:
+                if not self._aggregator_started:
+                    threading.Thread(target=self._aggregate, name="eval-aggregator", daemon=True).start()
+                    self._aggregator_started = True
+        self._events.put(event)
+    
+    def _aggregate(self):
+        """Apply queued results and judge scores in arrival order"""
+        while True:
+            kind, payload = self._events.get()
+            try:
+                if kind == 'result':
+                    self.evaluation_history.append(payload)
+                    self._update_performance_metrics(payload)
+                elif kind == 'judge':
+                    self._record_metric('accuracy', payload)
+            except Exception as e:
+                logger.warning("Evaluation aggregation failed: %s", e)
     
     def evaluate_conversation(self, user_input: str, agent_response: str, context: Dict = None) -> EvaluationResult:
         """Evaluate a single conversation turn"""
-        start_time = time.time()
-        
-        # Calculate response time
-        response_time = time.time() - start_time
-        
-        # Run LLM-as-Judge evaluation
-        llm_score = self._llm_judge_evaluation(user_input, agent_response, context)
+        start_time = time.perf_counter()
         
         # Calculate accuracy metrics
-        accuracy_metrics = self._calculate_accuracy_metrics(user_input, agent_response, context)
+        # Lowercase each text once and share it with every check
+        ui_low = user_input.lower()
+        resp_low = agent_response.lower()
+        accuracy_metrics = self._calculate_accuracy_metrics(user_input, agent_response, context, ui_low, resp_low)
+        
+        # Calculate response time (monotonic; the LLM judge runs in the background)
+        response_time = time.perf_counter() - start_time
         
         # Create evaluation result
         result = EvaluationResult(
-            test_id=f"eval_{int(time.time())}",
+            test_id=uuid4().hex,
             timestamp=time.time(),
             user_input=user_input,
             agent_response=agent_response,
             metrics={
                 'response_time': response_time,
-                'llm_judge_score': llm_score,
                 **accuracy_metrics
-            },
-            llm_judge_score=llm_score
+            }
         )
         
-        self.evaluation_history.append(result)
-        self._update_performance_metrics(result)
+        self._enqueue(('result', result))
+        
+        # Run LLM-as-Judge evaluation in the background; the score lands on `result`
+        result.llm_judge_future = _JUDGE_POOL.submit(
+            self._judge_and_record, result, user_input, agent_response, context
+        )
         
         return result
     
+    def _judge_and_record(self, result: EvaluationResult, user_input: str, agent_response: str, context: Dict = None) -> float:
+        """Score `result` with the LLM judge and record it (runs on the judge pool)"""
+        llm_score = self._llm_judge_evaluation(user_input, agent_response, context)
+        result.llm_judge_score = llm_score
+        result.metrics['llm_judge_score'] = llm_score
+        self._enqueue(('judge', llm_score))
+        self._log_result(result)
+        return llm_score
+    
+    def _log_result(self, result: EvaluationResult):
+        """Buffer a scored result; write the buffer once it is large or old enough"""
+        record = {
+            'test_id': result.test_id,
+            'timestamp': result.timestamp,
+            'user_input': result.user_input,
+            'agent_response': result.agent_response,
+            'metrics': result.metrics,
+            'llm_judge_score': result.llm_judge_score,
+            'human_feedback': result.human_feedback
+        }
+        with self._log_lock:
+            self._pending_log.append(json.dumps(record, ensure_ascii=False))
+            due = (len(self._pending_log) >= EVAL_FLUSH_BATCH
+                   or time.monotonic() - self._last_flush >= EVAL_FLUSH_INTERVAL)
+        if due:
+            self.flush_log()
+    
+    def flush_log(self):
+        """Append all buffered results to EVAL_LOG with a single write"""
+        with self._log_lock:
+            batch, self._pending_log = self._pending_log, []
+            self._last_flush = time.monotonic()
+            if not batch:
+                return
+            try:
+                with open(EVAL_LOG, 'a', encoding='utf-8') as f:
+                    f.write('\n'.join(batch) + '\n')
+            except Exception as e:
+                logger.warning("Evaluation log flush failed: %s", e)
+    
     def _llm_judge_evaluation(self, user_input: str, agent_response: str, context: Dict = None) -> float:
         """Use LLM as judge to evaluate response quality"""
         
@@ -99,74 +228,79 @@ class NitisaraEvaluator:
     
     def _extract_score_from_judge_response(self, judge_response: str) -> float:
         """Extract numerical score from LLM judge response"""
-        import re
-        # Look for overall score pattern
-        score_match = re.search(r'overall score[:\s]*(\d+(?:\.\d+)?)', judge_response.lower())
-        if score_match:
-            return float(score_match.group(1))
-        
-        # Fallback: look for any number between 1-10
-        numbers = re.findall(r'\b(\d+(?:\.\d+)?)\b', judge_response)
-        for num in numbers:
-            score = float(num)
-            if 1 <= score <= 10:
-                return score
+        # Single scan: an overall score wins outright; otherwise fall back
+        # to the first number between 1-10
+        fallback = None
+        for match in _JUDGE_SCORE_RE.finditer(judge_response.lower()):
+            if match.group('overall') is not None:
+                return float(match.group('overall'))
+            if fallback is None:
+                score = float(match.group('num'))
+                if 1 <= score <= 10:
+                    fallback = score
+        
+        if fallback is not None:
+            return fallback
         
         return 5.0  # Default neutral score
     
-    def _calculate_accuracy_metrics(self, user_input: str, agent_response: str, context: Dict = None) -> Dict[str, float]:
+    def _calculate_accuracy_metrics(self, user_input: str, agent_response: str, context: Dict = None,
+                                    ui_low: str = None, resp_low: str = None) -> Dict[str, float]:
         """Calculate accuracy metrics for the response"""
         metrics = {}
+        if ui_low is None:
+            ui_low = user_input.lower()
+        if resp_low is None:
+            resp_low = agent_response.lower()
+        hits = _keyword_hits(resp_low)
+        # One scan of the user input gates the category checks
+        triggers = _keyword_hits(ui_low)
         
         # Check for compliance accuracy
-        if 'compliance' in user_input.lower() or 'document' in user_input.lower():
-            metrics['compliance_accuracy'] = self._check_compliance_accuracy(agent_response)
+        if triggers & _COMPLIANCE_TRIGGERS:
+            metrics['compliance_accuracy'] = self._check_compliance_accuracy(agent_response, hits)
         
         # Check for rate estimation accuracy
-        if 'rate' in user_input.lower() or 'price' in user_input.lower() or 'cost' in user_input.lower():
-            metrics['rate_accuracy'] = self._check_rate_accuracy(agent_response)
+        if triggers & _RATE_TRIGGERS:
+            metrics['rate_accuracy'] = self._check_rate_accuracy(agent_response, hits)
         
         # Check for general accuracy indicators
         metrics['response_completeness'] = self._check_response_completeness(agent_response)
-        metrics['professional_tone'] = self._check_professional_tone(agent_response)
+        metrics['professional_tone'] = self._check_professional_tone(agent_response, resp_low)
         
         return metrics
     
-    def _check_compliance_accuracy(self, response: str) -> float:
+    def _check_compliance_accuracy(self, response: str, hits: Set[str] = None) -> float:
         """Check if compliance response contains accurate information"""
-        score = 0.0
+        if hits is None:
+            hits = _keyword_hits(response.lower())
         
         # Check for compliance keywords
-        compliance_keywords = ['compliance', 'document', 'certificate', 'hs code', 'trade']
-        for keyword in compliance_keywords:
-            if keyword in response.lower():
-                score += 1.0
+        score = float(len(hits & _COMPLIANCE_KEYWORDS))
         
         # Check for specific compliance elements
         if '✅' in response or '⚠️' in response:
             score += 1.0
         
-        if 'hs code' in response.lower():
+        if 'hs code' in hits:
             score += 1.0
         
         return min(score / 3.0, 1.0)  # Normalize to 0-1
     
-    def _check_rate_accuracy(self, response: str) -> float:
+    def _check_rate_accuracy(self, response: str, hits: Set[str] = None) -> float:
         """Check if rate response contains accurate pricing information"""
-        score = 0.0
+        if hits is None:
+            hits = _keyword_hits(response.lower())
         
         # Check for rate-related keywords
-        rate_keywords = ['rate', 'price', 'cost', '₹', 'inr', 'usd']
-        for keyword in rate_keywords:
-            if keyword in response.lower():
-                score += 1.0
+        score = float(len(hits & _RATE_KEYWORDS))
         
         # Check for multiple shipping options
-        if 'sea' in response.lower() and 'air' in response.lower():
+        if 'sea' in hits and 'air' in hits:
             score += 1.0
         
         # Check for CO2e information
-        if 'co₂e' in response.lower() or 'carbon' in response.lower():
+        if hits & _CO2_KEYWORDS:
             score += 1.0
         
         return min(score / 3.0, 1.0)  # Normalize to 0-1
@@ -181,34 +315,27 @@ class NitisaraEvaluator:
         else:
             return 1.0
     
-    def _check_professional_tone(self, response: str) -> float:
+    def _check_professional_tone(self, response: str, resp_low: str = None) -> float:
         """Check if response maintains professional tone"""
-        score = 1.0
-        
-        # Check for unprofessional language
-        unprofessional_words = ['damn', 'crap', 'stupid', 'idiot']
-        for word in unprofessional_words:
-            if word in response.lower():
-                score -= 0.3
+        if resp_low is None:
+            resp_low = response.lower()
         
-        # Check for professional elements
-        professional_elements = ['thank you', 'please', 'recommend', 'suggest']
-        for element in professional_elements:
-            if element in response.lower():
-                score += 0.1
+        # Penalize unprofessional language, reward professional elements (each distinct word once)
+        score = (1.0 - 0.3 * len(set(_UNPROF_RE.findall(resp_low)))
+                 + 0.1 * len(set(_PROF_RE.findall(resp_low))))
         
         return max(0.0, min(score, 1.0))
     
     def _update_performance_metrics(self, result: EvaluationResult):
         """Update running performance metrics"""
-        self.performance_metrics['response_time'].append(result.metrics.get('response_time', 0))
-        self.performance_metrics['accuracy'].append(result.llm_judge_score)
+        self.total_evaluations += 1
+        self._record_metric('response_time', result.metrics.get('response_time', 0))
         
         if 'compliance_accuracy' in result.metrics:
-            self.performance_metrics['compliance_accuracy'].append(result.metrics['compliance_accuracy'])
+            self._record_metric('compliance_accuracy', result.metrics['compliance_accuracy'])
         
         if 'rate_accuracy' in result.metrics:
-            self.performance_metrics['rate_accuracy'].append(result.metrics['rate_accuracy'])
+            self._record_metric('rate_accuracy', result.metrics['rate_accuracy'])
     
     def run_ab_test(self, test_scenarios: List[Dict], iterations: int = 10) -> Dict[str, Any]:
         """Run A/B test comparing different agent configurations"""
@@ -242,6 +369,10 @@ class NitisaraEvaluator:
         if not scenario_a or not scenario_b:
             return {'error': 'Insufficient data for comparison'}
         
+        # Judge scores arrive asynchronously; wait for them before comparing
+        for r in scenario_a + scenario_b:
+            r.wait_for_judge()
+        
         # Calculate average scores
         avg_score_a = sum(r.llm_judge_score for r in scenario_a) / len(scenario_a)
         avg_score_b = sum(r.llm_judge_score for r in scenario_b) / len(scenario_b)
@@ -261,25 +392,31 @@ class NitisaraEvaluator:
         }
     
     def get_performance_summary(self) -> Dict[str, Any]:
-        """Get overall performance summary"""
+        """Get overall performance summary (running totals; never waits on the aggregator)"""
         if not self.evaluation_history:
             return {'error': 'No evaluation data available'}
         
+        averages = {
+            metric: self._metric_sums[metric] / count
+            for metric, count in self._metric_counts.items() if count
+        }
+        
         summary = {
-            'total_evaluations': len(self.evaluation_history),
-            'average_llm_score': sum(r.llm_judge_score for r in self.evaluation_history) / len(self.evaluation_history),
-            'average_response_time': sum(r.metrics.get('response_time', 0) for r in self.evaluation_history) / len(self.evaluation_history)
+            'total_evaluations': self.total_evaluations,
+            # Judge scores are counted as the background judge finishes
+            'average_llm_score': averages.get('accuracy', 0.0),
+            'average_response_time': averages.get('response_time', 0)
         }
         
         # Add metric-specific averages
-        for metric, values in self.performance_metrics.items():
-            if values:
-                summary[f'average_{metric}'] = sum(values) / len(values)
+        for metric, value in averages.items():
+            summary[f'average_{metric}'] = value
         
         return summary
 
 # Global evaluator instance
 evaluator = NitisaraEvaluator()
+atexit.register(evaluator.flush_log)
 
 def evaluate_agent_response(user_input: str, agent_response: str, context: Dict = None) -> EvaluationResult:
     """Convenience function to evaluate agent response"""
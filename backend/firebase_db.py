@@ -2,12 +2,74 @@ import firebase_admin
 from firebase_admin import credentials, db
 from config import FIREBASE_DB_URL, FIREBASE_CREDENTIALS
 import os
+import re
 import json
+import time
+import copy
+import threading
+import atexit
+import logging
+from contextlib import contextmanager
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # Windows: local demo mode is then single-process only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
 
 # Local JSON file for persistence in demo mode
 LOCAL_DB_FILE = "local_db.json"
+# Demo-mode messages: one append-only JSONL file per user
+LOCAL_MSG_DIR = "local_msgs"
 
-def _load_local_db():
+# Optimistic state cache: reads are served locally, writes go out in the background.
+# An entry is pinned while its write is in flight, then served for STATE_TTL
+# more seconds, so state written by other server processes shows up soon after
+STATE_TTL = float(os.getenv("STATE_TTL", "0.5"))  # seconds
+STATE_CACHE_SIZE = 10_000
+_LOCAL_STATE = OrderedDict()  # user -> [expires_at (monotonic), state], LRU order
+_STATE_STAMPS = {}  # user -> stamp of the newest state not yet written
+_STATE_LOCK = threading.Lock()
+_IO_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="firebase-io")
+# Background writes for one user run one at a time, so an older state never lands last
+USER_WRITE_SHARDS = 64
+_USER_WRITE_LOCKS = [threading.Lock() for _ in range(USER_WRITE_SHARDS)]
+_LOCAL_DB_LOCK = threading.RLock()
+
+# In-memory copy of the local JSON DB. Writes mark their keys dirty and a background
+# thread merges them into the file after a short coalescing window. Merges re-read the
+# file under a cross-process lock, so several server workers can share one local DB
+_LOCAL_CACHE = None
+_LOCAL_VERSION = None  # (inode, mtime) of the file the cache was last synced with
+_DIRTY_KEYS = set()
+_FLUSH_DELAY = 0.1  # seconds
+_FLUSH_EVENT = threading.Event()
+_flusher_started = False
+
+# Last few messages per user, for building prompt history without a full fetch.
+# Served for HISTORY_TTL (and while this process has a turn write in flight),
+# then refetched, so turns handled by other server processes are picked up
+HISTORY_WINDOW = 6
+HISTORY_TTL = float(os.getenv("HISTORY_TTL", "0.5"))  # seconds
+HISTORY_CACHE_SIZE = 10_000
+_HISTORY_CACHE = OrderedDict()  # user -> [expires_at (monotonic), deque, writes in flight], LRU order
+_HISTORY_LOCK = threading.Lock()
+
+# Full message history per user for a short TTL, absorbing bursts of /api/history polls
+# Writes in this process invalidate an entry at once; the TTL only bounds
+# staleness from writes made by other server processes. Every write bumps a
+# generation, and a read that started before a write to its user is not cached
+MESSAGES_TTL = float(os.getenv("MESSAGES_TTL", "0.5"))  # seconds
+MESSAGES_CACHE_SIZE = 10_000
+_MESSAGES_CACHE = OrderedDict()  # user -> [fetched at (monotonic), messages or None, last write generation], LRU order
+_MESSAGES_GEN = 0
+_MESSAGES_EVICTED_GEN = 0  # newest write generation among evicted entries
+_MESSAGES_LOCK = threading.Lock()
+
+def _read_local_file():
     if os.path.exists(LOCAL_DB_FILE):
         try:
             with open(LOCAL_DB_FILE, 'r') as f:
@@ -16,58 +78,350 @@ def _load_local_db():
             return {}
     return {}
 
-def _save_local_db(data):
-    with open(LOCAL_DB_FILE, 'w') as f:
-        json.dump(data, f, indent=4)
+def _local_version():
+    try:
+        st = os.stat(LOCAL_DB_FILE)
+        return st.st_ino, st.st_mtime_ns  # every save is an os.replace, i.e. a new inode
+    except FileNotFoundError:
+        return None
+
+@contextmanager
+def _local_file_lock():
+    """Exclusive lock on local_db.json shared by every process (no-op where fcntl is missing)."""
+    if fcntl is None:
+        yield
+        return
+    with open(f"{LOCAL_DB_FILE}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _load_local_db():
+    """The cached local DB, reloaded when another process has rewritten the file."""
+    global _LOCAL_CACHE, _LOCAL_VERSION
+    version = _local_version()
+    if _LOCAL_CACHE is None or version != _LOCAL_VERSION:
+        with _LOCAL_DB_LOCK:
+            if _LOCAL_CACHE is None or version != _LOCAL_VERSION:
+                data = _read_local_file()
+                for key in _DIRTY_KEYS:  # keep writes this process has not flushed yet
+                    data[key] = _LOCAL_CACHE[key]
+                _LOCAL_CACHE, _LOCAL_VERSION = data, version
+    return _LOCAL_CACHE
+
+def _save_local_db(key, value):
+    global _flusher_started
+    with _LOCAL_DB_LOCK:
+        _load_local_db()[key] = value
+        _DIRTY_KEYS.add(key)
+        if not _flusher_started:
+            threading.Thread(target=_flush_loop, name="local-db-flusher", daemon=True).start()
+            _flusher_started = True
+    _FLUSH_EVENT.set()
+
+def _sync_local_db(update=None):
+    """Merge dirty keys (and `update(data)`) into the file on disk, under the file lock.
+
+    The file is re-read first, so keys written by other processes are kept; it is
+    then replaced atomically via a temp file. Returns what `update` returned.
+    """
+    global _LOCAL_CACHE, _LOCAL_VERSION
+    with _LOCAL_DB_LOCK, _local_file_lock():
+        data = _read_local_file()
+        for key in _DIRTY_KEYS:
+            data[key] = _LOCAL_CACHE[key]
+        result = update(data) if update else None
+        tmp_path = f"{LOCAL_DB_FILE}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(json.dumps(data, indent=4))
+        os.replace(tmp_path, LOCAL_DB_FILE)
+        _DIRTY_KEYS.clear()
+        _LOCAL_CACHE, _LOCAL_VERSION = data, _local_version()
+    return result
+
+def _flush():
+    with _LOCAL_DB_LOCK:
+        if _DIRTY_KEYS:
+            _sync_local_db()
+
+def _flush_loop():
+    while True:
+        _FLUSH_EVENT.wait()
+        time.sleep(_FLUSH_DELAY)
+        _FLUSH_EVENT.clear()
+        try:
+            _flush()
+        except Exception as e:
+            logger.warning("⚠️ Local DB flush failed: %s", e)
+
+atexit.register(_flush)
+
+def _local_msg_path(user):
+    return os.path.join(LOCAL_MSG_DIR, re.sub(r'[^\w.-]', '_', user) + ".jsonl")
+
+def _append_local_messages(user, entries):
+    """Append messages to the user's JSONL file with a single write."""
+    payload = "".join(json.dumps(e) + "\n" for e in entries)
+    with _LOCAL_DB_LOCK:
+        os.makedirs(LOCAL_MSG_DIR, exist_ok=True)
+        with open(_local_msg_path(user), "a", encoding="utf-8") as f:
+            f.write(payload)
+
+def _iter_local_messages(user):
+    """Yield messages in order: legacy entries from the JSON DB, then the JSONL log."""
+    yield from _load_local_db().get(f'{user}_messages', [])
+    with _LOCAL_DB_LOCK:
+        try:
+            with open(_local_msg_path(user), "r", encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
 
 def init_firebase():
     # Skip Firebase initialization if credentials are not available
     if not os.path.exists(FIREBASE_CREDENTIALS):
-        print(f"⚠️ Firebase credentials not found. Using local file '{LOCAL_DB_FILE}' for storage.")
+        logger.warning("⚠️ Firebase credentials not found. Using local file '%s' for storage.", LOCAL_DB_FILE)
+        _load_local_db()
         return
-    
+
     if not firebase_admin._apps:
         try:
             cred = credentials.Certificate(FIREBASE_CREDENTIALS)
             firebase_admin.initialize_app(cred, {"databaseURL": FIREBASE_DB_URL})
         except Exception as e:
-            print(f"Warning: Firebase initialization failed: {e}. Using local file storage.")
+            logger.warning("Firebase initialization failed: %s. Using local file storage.", e)
 
-def store_state(user, state):
+def _write_state(user, state):
     if firebase_admin._apps:
         ref = db.reference(f'/users/{user}/state')
         ref.set(state)
     else:
-        data = _load_local_db()
-        data[f'{user}_state'] = state
-        _save_local_db(data)
+        _save_local_db(f'{user}_state', state)
+
+def _user_write_lock(user):
+    return _USER_WRITE_LOCKS[hash(user) % USER_WRITE_SHARDS]
+
+def _cache_state(user, snapshot, stamp):
+    """Serve `snapshot` locally until its write lands (see _state_landed)."""
+    with _STATE_LOCK:
+        _STATE_STAMPS[user] = stamp
+        _LOCAL_STATE[user] = [float("inf"), snapshot]
+        _LOCAL_STATE.move_to_end(user)
+        if len(_LOCAL_STATE) > STATE_CACHE_SIZE:
+            _LOCAL_STATE.popitem(last=False)
+
+def _is_latest(user, stamp):
+    with _STATE_LOCK:
+        return _STATE_STAMPS.get(user) == stamp
+
+def _state_landed(user, stamp):
+    """The state written with `stamp` is stored; unless a newer one is pending, start its TTL."""
+    with _STATE_LOCK:
+        if _STATE_STAMPS.get(user) != stamp:
+            return
+        del _STATE_STAMPS[user]
+        entry = _LOCAL_STATE.get(user)
+        if entry is not None:
+            entry[0] = time.monotonic() + STATE_TTL
+
+def _persist_state(user, state, stamp):
+    """Background write, retried once; skipped once a newer store_state superseded it."""
+    with _user_write_lock(user):
+        for attempt in range(2):
+            if not _is_latest(user, stamp):
+                return  # the newer write (queued behind this lock) wins
+            try:
+                _write_state(user, state)
+                _state_landed(user, stamp)
+                return
+            except Exception as e:
+                logger.log(logging.DEBUG if attempt == 0 else logging.WARNING,
+                           "State write failed for %s (attempt %d): %s", user, attempt + 1, e)
+
+def store_state(user, state):
+    snapshot = copy.deepcopy(state)
+    stamp = time.time_ns()
+    _cache_state(user, snapshot, stamp)
+    _IO_POOL.submit(_persist_state, user, snapshot, stamp)
 
 def get_state(user):
+    with _STATE_LOCK:
+        entry = _LOCAL_STATE.get(user)
+        if entry is not None and time.monotonic() >= entry[0]:
+            del _LOCAL_STATE[user]  # expired: re-read what other processes may have written
+            entry = None
+        elif entry is not None:
+            _LOCAL_STATE.move_to_end(user)
+    if entry is not None:
+        return copy.deepcopy(entry[1])
     if firebase_admin._apps:
         ref = db.reference(f'/users/{user}/state')
         return ref.get() or {}
     else:
         data = _load_local_db()
-        return data.get(f'{user}_state', {})
+        return copy.deepcopy(data.get(f'{user}_state', {}))
+
+def _cache_messages(user, entries, in_flight=False):
+    """Add new messages to the history window; `in_flight` pins it until _history_landed."""
+    _invalidate_messages(user)
+    with _HISTORY_LOCK:
+        entry = _HISTORY_CACHE.get(user)
+        if entry is not None:
+            entry[1].extend(entries)
+            entry[2] += in_flight
+
+def _put_messages_entry(user, entry):
+    """Store a message cache entry, evicting the LRU one (caller holds _MESSAGES_LOCK)."""
+    global _MESSAGES_EVICTED_GEN
+    _MESSAGES_CACHE[user] = entry
+    _MESSAGES_CACHE.move_to_end(user)
+    if len(_MESSAGES_CACHE) > MESSAGES_CACHE_SIZE:
+        _, evicted = _MESSAGES_CACHE.popitem(last=False)
+        _MESSAGES_EVICTED_GEN = max(_MESSAGES_EVICTED_GEN, evicted[2])
+
+def _invalidate_messages(user):
+    """A write for `user` is happening: drop its cached history and refuse reads begun earlier."""
+    global _MESSAGES_GEN
+    with _MESSAGES_LOCK:
+        _MESSAGES_GEN += 1
+        _put_messages_entry(user, [float("-inf"), None, _MESSAGES_GEN])
+
+def _history_landed(user):
+    """A background turn write finished; the window's TTL applies again once none are left."""
+    with _HISTORY_LOCK:
+        entry = _HISTORY_CACHE.get(user)
+        if entry is not None and entry[2]:
+            entry[2] -= 1
+            entry[0] = time.monotonic() + HISTORY_TTL
+
+def _fresh_history(user):
+    """The cached window if it is still valid (caller holds _HISTORY_LOCK)."""
+    entry = _HISTORY_CACHE.get(user)
+    if entry is None or not (entry[2] or time.monotonic() < entry[0]):
+        return None
+    _HISTORY_CACHE.move_to_end(user)
+    return list(entry[1])
 
 def append_message(user, role, message):
+    _cache_messages(user, [{"role": role, "content": message}])
     if firebase_admin._apps:
         ref = db.reference(f'/users/{user}/messages')
         ref.push({"role": role, "content": message})
     else:
-        data = _load_local_db()
-        key = f'{user}_messages'
-        if key not in data:
-            data[key] = []
-        data[key].append({"role": role, "content": message})
-        _save_local_db(data)
+        _append_local_messages(user, [{"role": role, "content": message}])
 
 def get_messages(user):
+    with _MESSAGES_LOCK:
+        cached = _MESSAGES_CACHE.get(user)
+        if cached is not None and time.monotonic() - cached[0] < MESSAGES_TTL:
+            _MESSAGES_CACHE.move_to_end(user)
+            return cached[1]
+        read_gen = _MESSAGES_GEN
     if firebase_admin._apps:
         ref = db.reference(f'/users/{user}/messages')
-        return ref.get() or {}
+        messages = ref.get() or {}
     else:
-        data = _load_local_db()
-        messages = data.get(f'{user}_messages', [])
         # Return in format expected by frontend {id: msg, ...}
-        return {str(i): msg for i, msg in enumerate(messages)}
\ No newline at end of file
+        messages = {str(i): msg for i, msg in enumerate(_iter_local_messages(user))}
+    with _MESSAGES_LOCK:
+        cached = _MESSAGES_CACHE.get(user)
+        last_write = cached[2] if cached is not None else _MESSAGES_EVICTED_GEN
+        if last_write <= read_gen:  # otherwise a write landed meanwhile and this read may be stale
+            _put_messages_entry(user, [time.monotonic(), messages, last_write])
+    return messages
+
+def get_recent_messages(user):
+    """Return the last HISTORY_WINDOW messages, refetching them once the cached window expires."""
+    with _HISTORY_LOCK:
+        recent = _fresh_history(user)
+    if recent is not None:
+        return recent
+    if firebase_admin._apps:
+        ref = db.reference(f'/users/{user}/messages')
+        latest = ref.order_by_key().limit_to_last(HISTORY_WINDOW).get() or {}
+        msgs = latest.values()
+    else:
+        msgs = _iter_local_messages(user)
+    window = deque(msgs, maxlen=HISTORY_WINDOW)
+    with _HISTORY_LOCK:
+        recent = _fresh_history(user)  # a write in this process may have refreshed it meanwhile
+        if recent is not None:
+            return recent
+        _HISTORY_CACHE[user] = [time.monotonic() + HISTORY_TTL, window, 0]
+        _HISTORY_CACHE.move_to_end(user)
+        if len(_HISTORY_CACHE) > HISTORY_CACHE_SIZE:
+            _HISTORY_CACHE.popitem(last=False)
+    return list(window)
+
+def append_messages_batch(user, messages):
+    """Append several (role, message) pairs with a single write."""
+    entries = [{"role": role, "content": message} for role, message in messages]
+    if not entries:
+        return
+    _cache_messages(user, entries)
+    if firebase_admin._apps:
+        # Time-based numeric keys keep chronological order in one update()
+        base = time.time_ns()
+        ref = db.reference(f'/users/{user}/messages')
+        ref.update({str(base + i): entry for i, entry in enumerate(entries)})
+    else:
+        _append_local_messages(user, entries)
+
+def _write_turn(user, state, updates, entries):
+    if firebase_admin._apps:
+        # One multi-location update: a single round trip, applied atomically
+        paths = dict(updates)
+        if state is not None:
+            paths[f'users/{user}/state'] = state
+        db.reference('/').update(paths)
+    else:
+        if state is not None:
+            _write_state(user, state)
+        _append_local_messages(user, entries)
+
+def _persist_turn(user, state, updates, entries, stamp):
+    """Background write of a chat turn, retried once with the same message keys.
+    The state goes along only while it is still the newest; the messages always do."""
+    try:
+        with _user_write_lock(user):
+            for attempt in range(2):
+                latest = _is_latest(user, stamp)
+                try:
+                    _write_turn(user, state if latest else None, updates, entries)
+                    _invalidate_messages(user)  # drop any history read before the write landed
+                    if latest:
+                        _state_landed(user, stamp)
+                    return
+                except Exception as e:
+                    logger.log(logging.DEBUG if attempt == 0 else logging.WARNING,
+                               "Turn write failed for %s (attempt %d): %s", user, attempt + 1, e)
+    finally:
+        _history_landed(user)
+
+def commit_turn(user, state, messages):
+    """Persist the user's state and several (role, message) pairs as one write."""
+    entries = [{"role": role, "content": message} for role, message in messages]
+    snapshot = copy.deepcopy(state)
+    stamp = time.time_ns()
+    # Time-based numeric message keys, taken now so turns keep their order
+    updates = {f'users/{user}/messages/{stamp + i}': entry for i, entry in enumerate(entries)}
+    _cache_state(user, snapshot, stamp)
+    _cache_messages(user, entries, in_flight=True)
+    _IO_POOL.submit(_persist_turn, user, snapshot, updates, entries, stamp)
+
+def next_order_sequence():
+    """Atomically increment and return the global booking counter."""
+    if firebase_admin._apps:
+        ref = db.reference('/counters/NTS_SEQ')
+        return ref.transaction(lambda current: (current or 0) + 1)
+    return _sync_local_db(_bump_order_sequence)
+
+def _bump_order_sequence(data):
+    # Runs under the file lock on a fresh read, so workers never hand out the same number
+    data['NTS_SEQ'] = data.get('NTS_SEQ', 0) + 1
+    return data['NTS_SEQ']
@@ -6,22 +6,25 @@ Handles general reasoning, trade advisory, and open-ended queries.
 """
 
 import os
+import pickle
+import threading
+import faiss
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import SystemMessage, HumanMessage
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
 from langchain.chains import RetrievalQA
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+from config import GOOGLE_API_KEY
+from embedder import get_embedder, embed
 
 # ==============================================================
 # 1️⃣ Environment Setup
 # ==============================================================
 
-# Load environment variables
-load_dotenv()
-
+# Environment is loaded once in config.py
 # Ensure GOOGLE_API_KEY exists
-api_key = os.getenv("GOOGLE_API_KEY")
+api_key = GOOGLE_API_KEY
 if not api_key:
     raise ValueError("⚠️ GOOGLE_API_KEY not found in environment. Please add it to your .env file.")
 
@@ -42,6 +45,84 @@ llm = ChatGoogleGenerativeAI(
 # ==============================================================
 # 3️⃣ Core Function: ask_gemini()
 # ==============================================================
+# Heavy RAG objects are built once and reused across queries
+_EMBEDDINGS = None
+_QA_CACHE = {}  # db_name -> RetrievalQA chain
+_RAG_LOCK = threading.Lock()
+
+
+class _SharedEmbeddings(Embeddings):
+    """LangChain view of the process-wide MiniLM model, so RAG stores and rag_system load it once."""
+
+    def __init__(self, model):
+        self._model = model
+
+    def embed_documents(self, texts):
+        # Unit-length vectors, matching the normalized vectors the indexes are built from
+        return embed(self._model, list(texts)).tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def _get_embeddings():
+    """Wrap the shared MiniLM embedding model on first use."""
+    global _EMBEDDINGS
+    if _EMBEDDINGS is None:
+        model = get_embedder()
+        if model is None:
+            raise RuntimeError("MiniLM embedding model could not be loaded")
+        _EMBEDDINGS = _SharedEmbeddings(model)
+    return _EMBEDDINGS
+
+
+def _load_vector_store(db_path: str):
+    """
+    Load a saved FAISS store with its index memory-mapped read-only, so only the
+    pages searches touch are resident (falls back to a full load_local).
+    """
+    try:
+        index = faiss.read_index(os.path.join(db_path, "index.faiss"), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        db = FAISS.load_local(db_path, _get_embeddings(), allow_dangerous_deserialization=True)
+        index = db.index
+    else:
+        # The store's own files (written by save_local), read the way load_local does
+        with open(os.path.join(db_path, "index.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        db = FAISS(_get_embeddings(), index, docstore, index_to_docstore_id)
+    if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        # The strategy is not saved with the store; older L2 stores keep the default
+        db.distance_strategy = DistanceStrategy.MAX_INNER_PRODUCT
+    return db
+
+
+def _get_qa_chain(db_name: str, db_path: str):
+    """Return the cached QA chain for `db_name`, loading the FAISS index once."""
+    qa_chain = _QA_CACHE.get(db_name)
+    if qa_chain is None:
+        with _RAG_LOCK:
+            qa_chain = _QA_CACHE.get(db_name)
+            if qa_chain is None:
+                db = _load_vector_store(db_path)
+                retriever = db.as_retriever(search_kwargs={"k": 3})
+                qa_chain = _QA_CACHE[db_name] = RetrievalQA.from_chain_type(
+                    llm=llm,
+                    retriever=retriever,
+                    chain_type="stuff",
+                )
+    return qa_chain
+
+
+def reload_db(db_name: str = None):
+    """Drop cached QA chains (one dataset, or all) so the next query reloads from disk."""
+    with _RAG_LOCK:
+        if db_name is None:
+            _QA_CACHE.clear()
+        else:
+            _QA_CACHE.pop(db_name, None)
+
+
 def query_proprietary_data(query: str, db_name: str = "companies") -> str:
     """
     Search NITISARA proprietary FAISS-trained datasets (RAG layer).
@@ -56,18 +137,7 @@ def query_proprietary_data(query: str, db_name: str = "companies") -> str:
         if not os.path.exists(db_path):
             return f"[Error] Dataset '{db_name}' not found or not trained yet."
 
-        # Use HuggingFace for embeddings (free + local)
-        embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-        db = FAISS.load_local(db_path, embeddings, allow_dangerous_deserialization=True)
-
-        retriever = db.as_retriever(search_kwargs={"k": 3})
-
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=llm,
-            retriever=retriever,
-            chain_type="stuff",
-        )
-
+        qa_chain = _get_qa_chain(db_name, db_path)
         response = qa_chain.invoke(query)
         return response
 
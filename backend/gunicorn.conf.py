@@ -0,0 +1,13 @@
+"""gunicorn settings, picked up automatically from backend/ (see wsgi.py)."""
+
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+worker_class = "gevent"
+# One process per core (x2 + 1) sidesteps the GIL; gevent multiplexes I/O inside each
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+# Concurrent greenlets per worker; lower it if RAM per worker is tight
+worker_connections = int(os.getenv("WORKER_CONNECTIONS", "1000"))
+# Gemini and RAG calls can take a while
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
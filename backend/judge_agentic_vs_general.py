@@ -6,8 +6,18 @@ Evaluates factual (RAG) vs reasoning (Gemini) responses
 and produces a 'which is better' qualitative judgment.
 """
 
+import re
 import time
-from foundational_config import ask_gemini, query_proprietary_data
+# Pool, model calls, overlap and factual heuristic are shared with the full judge framework
+from model_judge_framework import (
+    _COMPARE_POOL, _ask_rag, _ask_general, _semantic_overlap, _estimate_factual_score,
+)
+
+SYSTEM_MESSAGE = "You are NITISARA Captain, a freight logistics expert providing clear, data-backed insights."
+
+# Reasoning heuristic: whole-word logic markers ('hence' must not fire inside
+# 'whence') found in one case-insensitive scan
+_LOGIC_RE = re.compile(r'\b(?:because|therefore|hence|means|implies)\b', re.I)
 
 
 def compare_agentic_vs_general(query: str, dataset: str):
@@ -15,21 +25,11 @@ def compare_agentic_vs_general(query: str, dataset: str):
 
     start_time = time.time()
 
-    # 1️⃣ Agentic (RAG)
-    try:
-        agentic = query_proprietary_data(query, dataset)
-        agentic_text = str(agentic)
-    except Exception as e:
-        agentic_text = f"[RAG Error] {str(e)}"
-
-    # 2️⃣ General (Gemini)
-    try:
-        general = ask_gemini(
-            prompt=query,
-            system_message="You are NITISARA Captain, a freight logistics expert providing clear, data-backed insights."
-        )
-    except Exception as e:
-        general = f"[Gemini Error] {str(e)}"
+    # 1️⃣ Agentic (RAG) and 2️⃣ General (Gemini), concurrently
+    rag_future = _COMPARE_POOL.submit(_ask_rag, query, dataset)
+    gemini_future = _COMPARE_POOL.submit(_ask_general, query, SYSTEM_MESSAGE)
+    agentic_text, _ = rag_future.result()
+    general, _ = gemini_future.result()
 
     duration = round(time.time() - start_time, 2)
     overlap = _semantic_overlap(agentic_text, general)
@@ -59,29 +59,13 @@ def compare_agentic_vs_general(query: str, dataset: str):
     return result
 
 
-def _semantic_overlap(text1: str, text2: str) -> float:
-    t1, t2 = set(str(text1).lower().split()), set(str(text2).lower().split())
-    if not t1 or not t2:
-        return 0.0
-    return round(len(t1 & t2) / len(t1 | t2), 2)
-
-
 def _estimate_reasoning_score(answer: str) -> float:
     """Heuristic for reasoning depth."""
     length = len(answer.split())
-    structure = sum(1 for w in ["because", "therefore", "hence", "means", "implies"] if w in answer.lower())
+    structure = len({w.lower() for w in _LOGIC_RE.findall(answer)})
     return min(1.0, 0.3 + 0.002 * length + 0.1 * structure)
 
 
-def _estimate_factual_score(answer: str) -> float:
-    """Heuristic for factual grounding."""
-    if "error" in answer.lower():
-        return 0.0
-    numbers = sum(c.isdigit() for c in answer)
-    has_ids = "id" in answer.lower() or "_" in answer
-    return min(1.0, 0.4 + 0.1 * has_ids + 0.02 * numbers)
-
-
 if __name__ == "__main__":
     query = "List all forwarders with CIF terms"
     dataset = "companies"
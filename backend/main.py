@@ -1,27 +1,104 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, send_from_directory, url_for, abort
+from werkzeug.security import safe_join
+from werkzeug.exceptions import RequestEntityTooLarge
+from flask.json.provider import JSONProvider
+from decimal import Decimal
+from typing import Optional
 from firebase_db import init_firebase, get_messages
 from captain_agent import captain_conversation
 from flask_cors import CORS
 import time
 import logging
+import orjson
+import msgspec
+import uuid
+import threading
+from collections import OrderedDict
+from dataclasses import asdict
+from concurrent.futures import ThreadPoolExecutor
 from monitoring import log_api_call, check_safety_violations, record_performance_metric, monitor
 from evaluation import evaluate_agent_response
-from rag_system import get_rag_response, search_knowledge_base
-from compliance.extract_text import extract_text_from_pdf
-from compliance.verify_details import extract_key_fields, verify_with_backend
 from datetime import datetime
-from fpdf import FPDF  # ✅ Add this line
+from io import BytesIO
+from pathlib import Path
 
 import os
+
+def _orjson_default(obj):
+    """Types orjson can't encode natively, handled as Flask's default provider does."""
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if hasattr(obj, "__html__"):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class OrjsonProvider(JSONProvider):
+    """Route jsonify() and request.get_json() through orjson."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS),
+            mimetype="application/json",
+        )
+
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app)
 
-# Setup logging
-logging.basicConfig(level=logging.INFO)
+# Logging goes through the queue handler monitoring installs on the root logger
 logger = logging.getLogger(__name__)
 
 init_firebase()
 
+# 📨 Request bodies, decoded and type-checked in one step by msgspec
+class ChatRequest(msgspec.Struct):
+    user: str = "demo"
+    session: str = "default"
+    message: str = ""
+
+
+class RagRequest(msgspec.Struct):
+    query: str = ""
+    category: Optional[str] = None
+    user: str = "demo"
+
+
+_CHAT_DECODER = msgspec.json.Decoder(ChatRequest)
+_RAG_DECODER = msgspec.json.Decoder(RagRequest)
+
+
+def _decode_body(decoder):
+    """Decode the raw request body; empty bodies give the defaults."""
+    try:
+        return decoder.decode(request.get_data(cache=False) or b"{}")
+    except msgspec.DecodeError as e:  # includes ValidationError
+        raise ValueError(f"Invalid request body: {e}")
+
+def _record_judge_score(future, user, session):
+    """Record a finished LLM judge score (runs as a done callback on the judge pool)."""
+    if future.cancelled() or future.exception() is not None:
+        logger.warning(f"LLM judge failed: {'cancelled' if future.cancelled() else future.exception()}")
+        return
+    record_performance_metric("llm_judge_score", future.result(), "score", tags={"user": user, "session": session})
+
+def _eval_and_record(message, reply, user, session):
+    """Evaluate a chat reply (cheap heuristics) and record its judge score once the judge finishes."""
+    try:
+        evaluation = evaluate_agent_response(message, reply, {"user": user, "session": session})
+        # Judge score is computed on evaluation's judge pool; record it when it lands
+        evaluation.llm_judge_future.add_done_callback(lambda fut: _record_judge_score(fut, user, session))
+    except Exception as e:
+        logger.warning(f"Evaluation failed: {e}")
+
 @app.route("/api/chat", methods=["POST"])
 def chat():
     """Enhanced chat endpoint with monitoring and safety checks"""
@@ -29,11 +106,9 @@ def chat():
     user = "demo"  # ensure defined for error paths
     session = "default"
     try:
-        data = request.get_json(silent=True) or {}
-        user = data.get("user", "demo")
-        session = data.get("session", "default")
+        req = _decode_body(_CHAT_DECODER)
+        user, session, message = req.user, req.session, req.message
         user_key = f"{user}:{session}"
-        message = data.get("message", "")
         if not message:
             raise ValueError("Missing 'message' in request body")
         # Check for safety violations
@@ -44,7 +119,7 @@ def chat():
                         error_message="Safety violation detected")
             return jsonify({
                 "reply": "I cannot process this request due to safety policy violations. Please rephrase your message.",
-                "safety_violations": [v.__dict__ for v in safety_violations]
+                "safety_violations": [asdict(v) for v in safety_violations]
             }), 400
         # Process conversation
         reply = captain_conversation(user_key, message)
@@ -53,12 +128,8 @@ def chat():
         record_performance_metric("response_time", response_time, "seconds", tags={"user": user, "session": session})
         # Log API call
         log_api_call("/api/chat", "POST", 200, response_time, user_key)
-        # Evaluate response quality
-        try:
-            evaluation = evaluate_agent_response(message, reply, {"user": user, "session": session})
-            record_performance_metric("llm_judge_score", evaluation.llm_judge_score, "score", tags={"user": user, "session": session})
-        except Exception as e:
-            logger.warning(f"Evaluation failed: {e}")
+        # Evaluate response quality; only the LLM judge runs in the background
+        _eval_and_record(message, reply, user, session)
         return jsonify({"reply": reply})
     except Exception as e:
         response_time = time.time() - start_time
@@ -76,7 +147,7 @@ def history():
     
     try:
         hist = get_messages(user_key)
-        res = [{"role": m["role"], "content": m["content"]} for k, m in (hist or {}).items()]
+        res = [{"role": m["role"], "content": m["content"]} for m in (hist or {}).values()]
         
         response_time = time.time() - start_time
         log_api_call("/api/history", "GET", 200, response_time, user_key)
@@ -90,13 +161,13 @@ def history():
 @app.route("/api/rag", methods=["POST"])
 def rag_query():
     """RAG system endpoint for knowledge base queries"""
+    from rag_system import get_rag_response  # 💤 loaded on first use, not at worker boot
     start_time = time.time()
+    user = "demo"  # ensure defined for error paths
     
     try:
-        data = request.json
-        query = data.get("query", "")
-        category = data.get("category", None)
-        user = data.get("user", "demo")
+        req = _decode_body(_RAG_DECODER)
+        query, category, user = req.query, req.category, req.user
         
         # Get RAG response
         response = get_rag_response(query, category, {"user": user})
@@ -114,6 +185,7 @@ def rag_query():
 @app.route("/api/search", methods=["GET"])
 def search_knowledge():
     """Search knowledge base endpoint"""
+    from rag_system import search_knowledge_base
     start_time = time.time()
     
     try:
@@ -140,13 +212,13 @@ def get_monitoring_data():
     user = request.args.get("user", "admin")
     
     try:
-        # Get monitoring report
-        report = monitor.generate_monitoring_report()
+        # Latest background snapshot, already serialized
+        report = monitor.get_report_snapshot()
         
         response_time = time.time() - start_time
         log_api_call("/api/monitoring", "GET", 200, response_time, user)
         
-        return jsonify(report)
+        return app.response_class(report, mimetype="application/json")
         
     except Exception as e:
         response_time = time.time() - start_time
@@ -163,6 +235,49 @@ def health_check():
         "service": "NITISARA Captain AI"
     })
 
+# 📄 Compliance uploads: parsing runs on worker threads; async uploads are polled by job id
+_UPLOAD_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="compliance-upload")
+# Larger request bodies are rejected with 413 before they are read into memory
+app.config["MAX_CONTENT_LENGTH"] = int(os.getenv("MAX_UPLOAD_MB", "20")) * 1024 * 1024
+# Jobs are dropped once their result is fetched, or UPLOAD_JOB_TTL after submission if never polled
+UPLOAD_JOB_TTL = 600  # seconds
+UPLOAD_JOBS_MAX = 1000
+_UPLOAD_JOBS = OrderedDict()  # job_id -> (submitted at (monotonic), Future), oldest first
+_UPLOAD_JOBS_LOCK = threading.Lock()
+
+
+def _add_upload_job(job_id, future):
+    """Register an async job, evicting expired (and, past UPLOAD_JOBS_MAX, the oldest) jobs."""
+    now = time.monotonic()
+    with _UPLOAD_JOBS_LOCK:
+        while _UPLOAD_JOBS:
+            submitted, old = next(iter(_UPLOAD_JOBS.values()))
+            if now - submitted < UPLOAD_JOB_TTL and len(_UPLOAD_JOBS) < UPLOAD_JOBS_MAX:
+                break
+            old.cancel()  # no-op once running; the result is simply discarded
+            _UPLOAD_JOBS.popitem(last=False)
+        _UPLOAD_JOBS[job_id] = (now, future)
+
+
+def _process_upload(filename, pdf_bytes):
+    """Extract, verify and summarize one uploaded PDF (runs on the upload pool)."""
+    from compliance.extract_text import iter_pdf_pages  # 💤 PyMuPDF loads on the first upload
+    from compliance.verify_details import extract_key_fields_from_pages, verify_with_backend
+    # Extract text page by page until the structured fields are settled
+    extracted_text, key_fields = extract_key_fields_from_pages(iter_pdf_pages(pdf_bytes), min_chars=500)
+
+    # Verify with backend/order DB
+    verification_result = verify_with_backend(key_fields)
+
+    # Combine summary
+    return {
+        "file_name": filename,
+        "summary": extracted_text[:500],  # trimmed preview
+        "key_fields": key_fields,
+        "verification": verification_result,
+    }
+
+
 @app.route("/api/compliance/upload", methods=["POST"])
 def compliance_upload():
     """
@@ -170,6 +285,8 @@ def compliance_upload():
     1. Extracts text from PDF.
     2. Extracts key fields (e.g., product name, HSN code, cargo info).
     3. Verifies with backend (e.g., order system or cargo manifest).
+    With `async=1` the request returns a job id at once; fetch the result
+    from /api/compliance/result/<job_id>.
     """
     start_time = time.time()
     user = request.form.get("user", "demo")
@@ -179,40 +296,54 @@ def compliance_upload():
         if "file" not in request.files:
             return jsonify({"error": "No file uploaded"}), 400
         
+        # The upload is parsed from memory; nothing is written to disk
         file = request.files["file"]
         filename = file.filename
-        file_path = os.path.join("uploads", filename)
-        os.makedirs("uploads", exist_ok=True)
-        file.save(file_path)
-
-        # Step 2: Extract text
-        extracted_text = extract_text_from_pdf(file_path)
 
-        # Step 3: Extract structured data
-        key_fields = extract_key_fields(extracted_text)
-
-        # Step 4: Verify with backend/order DB
-        verification_result = verify_with_backend(key_fields)
+        if request.values.get("async") in ("1", "true"):
+            job_id = uuid.uuid4().hex
+            _add_upload_job(job_id, _UPLOAD_POOL.submit(_process_upload, filename, file.read()))
+            response_time = time.time() - start_time
+            log_api_call("/api/compliance/upload", "POST", 202, response_time, user)
+            return jsonify({"job_id": job_id, "status": "pending"}), 202
 
-        # Step 5: Combine summary
-        summary = {
-            "file_name": filename,
-            "summary": extracted_text[:500],  # trimmed preview
-            "key_fields": key_fields,
-            "verification": verification_result,
-        }
+        summary = _process_upload(filename, file.read())
 
         response_time = time.time() - start_time
         log_api_call("/api/compliance/upload", "POST", 200, response_time, user)
 
         return jsonify(summary)
 
+    except RequestEntityTooLarge:
+        response_time = time.time() - start_time
+        log_api_call("/api/compliance/upload", "POST", 413, response_time, user)
+        return jsonify({"error": "File too large"}), 413
     except Exception as e:
         response_time = time.time() - start_time
         log_api_call("/api/compliance/upload", "POST", 500, response_time, user, error_message=str(e))
         logger.error(f"Compliance upload error: {e}")
         return jsonify({"error": "Failed to process document"}), 500
 
+
+@app.route("/api/compliance/result/<job_id>", methods=["GET"])
+def compliance_result(job_id):
+    """Poll the result of an async compliance upload."""
+    with _UPLOAD_JOBS_LOCK:
+        job = _UPLOAD_JOBS.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job id"}), 404
+    future = job[1]
+    if not future.done():
+        return jsonify({"job_id": job_id, "status": "pending"}), 202
+
+    with _UPLOAD_JOBS_LOCK:
+        _UPLOAD_JOBS.pop(job_id, None)
+    try:
+        return jsonify(future.result())
+    except Exception as e:
+        logger.error(f"Compliance upload error: {e}")
+        return jsonify({"error": "Failed to process document"}), 500
+
 """
 @app.route('/api/generate_laidbill', methods=['POST'])
 def generate_laidbill():
@@ -277,65 +408,86 @@ def generate_laidbill():
 """
 
 
+# 📁 Laid bills are served from static/bills; created once at startup
+BILL_DIR = Path(os.getcwd()) / "static" / "bills"
+BILL_DIR.mkdir(parents=True, exist_ok=True)
+# Behind nginx, set to an internal location aliased to BILL_DIR so nginx sends
+# the file itself (sendfile) instead of a worker, e.g. BILL_ACCEL_PREFIX=/internal/bills/
+#   location /internal/bills/ { internal; alias /app/backend/static/bills/; }
+BILL_ACCEL_PREFIX = os.getenv("BILL_ACCEL_PREFIX")
+
+# 🧾 Laid bill layout: fixed positions, so each request only draws its field values
+_LAIDBILL_PAGE_W, _LAIDBILL_PAGE_H = 210 * 72 / 25.4, 297 * 72 / 25.4  # A4 in points
+_LAIDBILL_LINE = 28.35  # 10 mm rows
+_LAIDBILL_FIELDS = [
+    ("Customer", "customer"),
+    ("Operator", "operator"),
+    ("Administrator", "administrator"),
+    ("Carrier", "carrier"),
+    ("Driver", "driver"),
+    ("Truck #", "truck_number"),
+    ("Trailer #", "trailer_number"),
+    ("Gross Weight", "gross"),
+    ("Net Weight", "net"),
+]
+_LAIDBILL_TITLE_Y = _LAIDBILL_PAGE_H - 2 * _LAIDBILL_LINE
+_LAIDBILL_FIELD_YS = [
+    _LAIDBILL_TITLE_Y - (i + 2) * _LAIDBILL_LINE for i in range(len(_LAIDBILL_FIELDS))
+]
+
+
+def _render_laidbill(data):
+    """Draw the laid bill onto one canvas page and return the PDF bytes."""
+    from reportlab.pdfgen import canvas  # 💤 loaded on the first bill
+    buf = BytesIO()
+    c = canvas.Canvas(buf, pagesize=(_LAIDBILL_PAGE_W, _LAIDBILL_PAGE_H))
+    c.setFont("Helvetica", 12)
+    c.drawCentredString(_LAIDBILL_PAGE_W / 2, _LAIDBILL_TITLE_Y, "BILL OF LADING")
+    for (label, key), y in zip(_LAIDBILL_FIELDS, _LAIDBILL_FIELD_YS):
+        c.drawString(28.35, y, f"{label}: {data.get(key)}")
+    c.save()
+    return buf.getvalue()
+
+
 @app.route("/api/generate_laidbill", methods=["POST"])
 def generate_laidbill():
     data = request.get_json()
     print("DEBUG BILL DATA:", data)  # 👀 Confirm incoming data
 
-    # ✅ Use field names exactly as sent from frontend
-    customer = data.get("customer")
-    operator = data.get("operator")
-    administrator = data.get("administrator")
-    carrier = data.get("carrier")
-    driver = data.get("driver")
-    truck = data.get("truck_number")
-    trailer = data.get("trailer_number")
-    gross = data.get("gross")
-    tare = data.get("tare")
-    net = data.get("net")
-    po = data.get("po_number")
-    job = data.get("job_number")
-    so = data.get("so_number")
-
-    # 📁 Create folder inside static if missing
-    bill_folder = os.path.join(os.getcwd(), "static", "bills")
-    os.makedirs(bill_folder, exist_ok=True)
-
     filename = f"laidbill_{int(datetime.now().timestamp())}.pdf"
-    filepath = os.path.join(bill_folder, filename)
-
-    # 🧾 Generate a simple PDF
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-    pdf.cell(200, 10, txt="BILL OF LADING", ln=True, align="C")
-    pdf.ln(10)
-    pdf.cell(200, 10, txt=f"Customer: {customer}", ln=True)
-    pdf.cell(200, 10, txt=f"Operator: {operator}", ln=True)
-    pdf.cell(200, 10, txt=f"Administrator: {administrator}", ln=True)
-    pdf.cell(200, 10, txt=f"Carrier: {carrier}", ln=True)
-    pdf.cell(200, 10, txt=f"Driver: {driver}", ln=True)
-    pdf.cell(200, 10, txt=f"Truck #: {truck}", ln=True)
-    pdf.cell(200, 10, txt=f"Trailer #: {trailer}", ln=True)
-    pdf.cell(200, 10, txt=f"Gross Weight: {gross}", ln=True)
-    pdf.cell(200, 10, txt=f"Net Weight: {net}", ln=True)
-    pdf.output(filepath)
+    filepath = BILL_DIR / filename
+
+    # 🧾 Render in memory, then write the finished PDF in one call
+    with open(filepath, "wb") as f:
+        f.write(_render_laidbill(data))
 
     print(f"✅ LAID BILL GENERATED: {filepath}")
 
     # ✅ Return the public URL
     return jsonify({
         "message": "Laid Bill generated successfully",
-        "file_url": f"http://127.0.0.1:5000/static/bills/{filename}",
-        "customer": customer,
-        "driver": driver,
-        "gross": gross,
-        "net": net
+        "file_url": url_for("download_bill", filename=filename, _external=True),
+        "customer": data.get("customer"),
+        "driver": data.get("driver"),
+        "gross": data.get("gross"),
+        "net": data.get("net")
     })
 
+@app.route("/bills/<path:filename>", methods=["GET"])
+def download_bill(filename):
+    """Serve a generated bill PDF, handing the transfer to nginx when configured."""
+    if not BILL_ACCEL_PREFIX:
+        return send_from_directory(BILL_DIR, filename, mimetype="application/pdf")
+    if safe_join(str(BILL_DIR), filename) is None:
+        abort(404)
+    response = app.response_class(mimetype="application/pdf")
+    response.headers["X-Accel-Redirect"] = BILL_ACCEL_PREFIX.rstrip("/") + "/" + filename
+    return response
+
 @app.route('/api/generate_bill', methods=['POST'])
 def generate_bill():
     """Generate a simple Laid Bill (mock backend)."""
+    import numpy as np
 
     try:
         data = request.get_json(force=True)
@@ -349,7 +501,7 @@ def generate_bill():
         # ✅ Handle cases where 'items' comes as string instead of list
         if isinstance(items_raw, str):
             try:
-                items = json.loads(items_raw.replace("'", '"'))
+                items = orjson.loads(items_raw.replace("'", '"'))
             except Exception as e:
                 return jsonify({"error": f"Invalid items JSON format: {str(e)}"}), 400
         else:
@@ -369,7 +521,16 @@ def generate_bill():
             return jsonify({"error": "Missing or invalid items list"}), 400
 
         # ✅ Compute totals safely
-        subtotal = sum(float(item.get('amount', 0)) for item in items)
+        # Bulk callers may send the amounts as a flat list alongside the items
+        amounts = data.get('amounts')
+        if isinstance(amounts, list) and len(amounts) == len(items):
+            amounts = np.asarray(amounts, dtype=np.float64)
+        else:
+            amounts = np.fromiter(
+                (float(item.get('amount', 0)) for item in items),
+                dtype=np.float64, count=len(items),
+            )
+        subtotal = float(amounts.sum())
         tax_amount = subtotal * (tax / 100)
         grand_total = subtotal + tax_amount
 
@@ -390,6 +551,6 @@ def generate_bill():
     except Exception as e:
         print("❌ BILL GENERATION ERROR:", e)
         return jsonify({"error": f"Bill generation failed: {str(e)}"}), 500
-if __name__ == "__main__":
+if __name__ == "__main__":  # local development only; production runs wsgi.py under gunicorn
     logger.info("Starting NITISARA Captain AI Server...")
     app.run(port=5000, debug=True)
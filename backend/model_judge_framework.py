@@ -9,13 +9,32 @@ Combines Tasks 8️⃣, 9️⃣, and 10️⃣:
 """
 
 import os
+import re
 import json
+import orjson
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache
 from foundational_config import ask_gemini, query_proprietary_data
 
 
-LOG_FILE = "model_judge_log.json"
+LOG_FILE = "model_judge_log.jsonl"  # shared with analytics_hooks (one JSON record per line)
+LEGACY_LOG_FILE = "model_judge_log.json"  # older JSON-array log, still counted in the summary
+
+# RAG and Gemini calls for one comparison run side by side (also used by judge_agentic_vs_general)
+_COMPARE_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="judge-compare")
+
+# Running totals for the performance summary, loaded from the logs on first use
+_STATS = None
+_STATS_LOCK = threading.Lock()
+
+# Score heuristics: whole-word logic markers ('thus' must not fire inside
+# 'enthusiast') found in one case-insensitive scan;
+# stripping non-digits leaves exactly the digits to count
+_LOGIC_RE = re.compile(r'\b(?:because|hence|therefore|means|thus)\b', re.I)
+_NON_DIGIT_RE = re.compile(r'\D+')
 
 
 # ============================================================
@@ -31,23 +50,15 @@ def compare_agentic_vs_general(query: str, dataset: str):
     start_time = time.time()
     error_flag = None
 
-    # ------------------ RAG / Agentic ------------------
-    try:
-        agentic = query_proprietary_data(query, dataset)
-        agentic_text = str(agentic)
-    except Exception as e:
-        agentic_text = f"[RAG Error] {str(e)}"
-        error_flag = "RAG"
-
-    # ------------------ Gemini ------------------
-    try:
-        general = ask_gemini(
-            prompt=query,
-            system_message="You are NITISARA Captain, a freight logistics expert. Give accurate, concise, and data-backed insights."
-        )
-    except Exception as e:
-        general = f"[Gemini Error] {str(e)}"
+    # ------------------ RAG / Agentic + Gemini, concurrently ------------------
+    rag_future = _COMPARE_POOL.submit(_ask_rag, query, dataset)
+    gemini_future = _COMPARE_POOL.submit(_ask_general, query)
+    agentic_text, rag_failed = rag_future.result()
+    general, gemini_failed = gemini_future.result()
+    if gemini_failed:
         error_flag = "Gemini"
+    elif rag_failed:
+        error_flag = "RAG"
 
     duration = round(time.time() - start_time, 2)
     overlap = _semantic_overlap(agentic_text, general)
@@ -63,7 +74,7 @@ def compare_agentic_vs_general(query: str, dataset: str):
         verdict = "⚖️ Balanced — factual vs conceptual alignment."
 
     result = {
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "ts_ns": time.time_ns(),  # formatted only when a report is rendered
         "query": query,
         "dataset": dataset,
         "agentic_answer": agentic_text,
@@ -80,31 +91,58 @@ def compare_agentic_vs_general(query: str, dataset: str):
     return result
 
 
+def _ask_rag(query, dataset):
+    """RAG / Agentic answer as (text, failed)."""
+    try:
+        return str(query_proprietary_data(query, dataset)), False
+    except Exception as e:
+        return f"[RAG Error] {str(e)}", True
+
+
+CAPTAIN_SYSTEM_MESSAGE = "You are NITISARA Captain, a freight logistics expert. Give accurate, concise, and data-backed insights."
+
+
+def _ask_general(query, system_message=CAPTAIN_SYSTEM_MESSAGE):
+    """Gemini answer as (text, failed)."""
+    try:
+        return ask_gemini(prompt=query, system_message=system_message), False
+    except Exception as e:
+        return f"[Gemini Error] {str(e)}", True
+
+
 # ============================================================
 # UTILITY HELPERS
 # ============================================================
 
+@lru_cache(maxsize=4096)
+def _token_set(text: str) -> frozenset:
+    """Lowercased token set, cached so repeated answers are tokenized once."""
+    return frozenset(text.lower().split())
+
+
 def _semantic_overlap(text1: str, text2: str) -> float:
     """Token-level overlap metric."""
-    t1, t2 = set(str(text1).lower().split()), set(str(text2).lower().split())
+    t1, t2 = _token_set(str(text1)), _token_set(str(text2))
     if not t1 or not t2:
         return 0.0
-    return round(len(t1 & t2) / len(t1 | t2), 2)
+    inter = len(t1 & t2)
+    return round(inter / (len(t1) + len(t2) - inter), 2)
 
 
 def _estimate_reasoning_score(answer: str) -> float:
     """Heuristic for reasoning depth (based on length and logic markers)."""
     length = len(answer.split())
-    logic_terms = sum(1 for w in ["because", "hence", "therefore", "means", "thus"] if w in answer.lower())
+    logic_terms = len({w.lower() for w in _LOGIC_RE.findall(answer)})
     return min(1.0, 0.25 + 0.002 * length + 0.1 * logic_terms)
 
 
 def _estimate_factual_score(answer: str) -> float:
     """Heuristic for factual structure: presence of IDs, numbers, or dataset-specific info."""
-    if "error" in answer.lower():
+    low = answer.lower()
+    if "error" in low:
         return 0.0
-    numbers = sum(c.isdigit() for c in answer)
-    has_ids = "id" in answer.lower() or "_" in answer
+    numbers = len(_NON_DIGIT_RE.sub("", answer))
+    has_ids = "id" in low or "_" in answer
     return min(1.0, 0.4 + 0.1 * has_ids + 0.02 * numbers)
 
 
@@ -112,19 +150,81 @@ def _estimate_factual_score(answer: str) -> float:
 # LOGGING & PERFORMANCE TRACKING
 # ============================================================
 
-def _log_result(entry):
-    """Store comparison result into JSON file."""
-    if not os.path.exists(LOG_FILE):
-        with open(LOG_FILE, "w", encoding="utf-8") as f:
-            json.dump([], f)
+def _display_entry(entry):
+    """Copy of a logged entry with a readable 'timestamp' (legacy entries already have one)."""
+    if "timestamp" in entry or "ts_ns" not in entry:
+        return entry
+    shown = dict(entry)
+    shown["timestamp"] = datetime.fromtimestamp(entry["ts_ns"] / 1e9).strftime("%Y-%m-%d %H:%M:%S")
+    return shown
+
+
+def _empty_stats():
+    return {
+        "total": 0,
+        "gemini_wins": 0,
+        "rag_wins": 0,
+        "sum_latency": 0.0,
+        "sum_overlap": 0.0,
+        "sum_factual": 0.0,
+        "sum_reasoning": 0.0,
+        "failures": [],
+    }
+
+
+def _add_to_stats(stats, entry):
+    stats["total"] += 1
+    stats["gemini_wins"] += "Gemini" in entry["final_verdict"]
+    stats["rag_wins"] += "Agentic" in entry["final_verdict"]
+    stats["sum_latency"] += entry["response_time_sec"]
+    stats["sum_overlap"] += entry["semantic_overlap"]
+    stats["sum_factual"] += entry["factual_score"]
+    stats["sum_reasoning"] += entry["reasoning_score"]
+    if entry.get("error_flag") is not None:
+        stats["failures"].append(entry)
+
 
-    with open(LOG_FILE, "r", encoding="utf-8") as f:
-        data = json.load(f)
+def _iter_log_entries():
+    """Yield every logged comparison: legacy JSON array first, then the JSONL log."""
+    if os.path.exists(LEGACY_LOG_FILE):
+        with open(LEGACY_LOG_FILE, "rb") as f:
+            yield from orjson.loads(f.read())
+    if os.path.exists(LOG_FILE):
+        with open(LOG_FILE, "rb") as f:
+            for line in f:
+                if line.strip():
+                    yield orjson.loads(line)
 
-    data.append(entry)
 
-    with open(LOG_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+def _load_stats():
+    stats = _empty_stats()
+    for entry in _iter_log_entries():
+        _add_to_stats(stats, entry)
+    return stats
+
+
+def rebuild_stats():
+    """Recompute the running totals by streaming the logs (cold start)."""
+    global _STATS
+    with _STATS_LOCK:
+        _STATS = _load_stats()
+        return _STATS
+
+
+def _record_stats(entry):
+    """Count a new comparison in the running totals (call before it is written)."""
+    global _STATS
+    with _STATS_LOCK:
+        if _STATS is None:
+            _STATS = _load_stats()
+        _add_to_stats(_STATS, entry)
+
+
+def _log_result(entry):
+    """Append comparison result to the JSONL log."""
+    _record_stats(entry)
+    with open(LOG_FILE, "ab") as f:
+        f.write(orjson.dumps(entry, option=orjson.OPT_APPEND_NEWLINE))
 
     print(f"📊 Logged comparison to {LOG_FILE}")
 
@@ -134,32 +234,27 @@ def _log_result(entry):
 # ============================================================
 
 def generate_performance_summary():
-    """Reads the log file and generates performance metrics."""
-    if not os.path.exists(LOG_FILE):
-        print("⚠️ No comparison logs found.")
-        return None
-
-    with open(LOG_FILE, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
-    total = len(data)
-    gemini_wins = sum(1 for d in data if "Gemini" in d["final_verdict"])
-    rag_wins = sum(1 for d in data if "Agentic" in d["final_verdict"])
-    avg_latency = round(sum(d["response_time_sec"] for d in data) / total, 2)
-    avg_overlap = round(sum(d["semantic_overlap"] for d in data) / total, 2)
-    avg_factual = round(sum(d["factual_score"] for d in data) / total, 2)
-    avg_reasoning = round(sum(d["reasoning_score"] for d in data) / total, 2)
-
-    report = {
-        "total_comparisons": total,
-        "avg_latency_sec": avg_latency,
-        "avg_semantic_overlap": avg_overlap,
-        "avg_factual_score": avg_factual,
-        "avg_reasoning_score": avg_reasoning,
-        "Gemini_wins": gemini_wins,
-        "RAG_wins": rag_wins,
-        "Failures_detected": [d for d in data if d["error_flag"] is not None],
-    }
+    """Generates performance metrics from the running totals."""
+    global _STATS
+    with _STATS_LOCK:
+        if _STATS is None:
+            _STATS = _load_stats()
+        stats = _STATS
+        total = stats["total"]
+        if not total:
+            print("⚠️ No comparison logs found.")
+            return None
+
+        report = {
+            "total_comparisons": total,
+            "avg_latency_sec": round(stats["sum_latency"] / total, 2),
+            "avg_semantic_overlap": round(stats["sum_overlap"] / total, 2),
+            "avg_factual_score": round(stats["sum_factual"] / total, 2),
+            "avg_reasoning_score": round(stats["sum_reasoning"] / total, 2),
+            "Gemini_wins": stats["gemini_wins"],
+            "RAG_wins": stats["rag_wins"],
+            "Failures_detected": [_display_entry(e) for e in stats["failures"]],
+        }
 
     print("\n📈 PERFORMANCE SUMMARY")
     print(json.dumps(report, indent=2))
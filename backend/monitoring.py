@@ -3,16 +3,45 @@ NITISARA AI Monitoring & Observability System
 Implements API integration, observability, safety guardrails, and performance optimization
 """
 
+import re
+import sys
 import time
 import json
+import orjson
+import atexit
 import logging
+import logging.handlers
+import queue
 from typing import Dict, List, Any, Optional
 from dataclasses import dataclass, asdict
 from datetime import datetime, timedelta
 import threading
+import numpy as np
 from collections import defaultdict, deque
 
-@dataclass
+try:
+    import hyperscan  # optional: one scan reports every safety pattern at once
+except ImportError:
+    hyperscan = None
+
+# Every built-in PII pattern needs a digit (card, SSN) or an '@' (email)
+_DIGIT_RE = re.compile(r'\d')
+
+# Rate-limit state is striped across locks so users rarely contend with each other
+RATE_LIMIT_SHARDS = 64
+
+# Last N API calls, kept column-wise in a ring buffer
+API_CALL_CAPACITY = 10000
+# Record types are immutable and, on Python 3.10+, slotted (no per-instance __dict__)
+_RECORD_OPTIONS = {'frozen': True, 'slots': True} if sys.version_info >= (3, 10) else {'frozen': True}
+
+# Safety violation counts are kept per minute, for this long
+SAFETY_BUCKET_SECONDS = 60
+SAFETY_BUCKET_RETENTION = 24 * 3600
+# Queued API calls are recorded by one background thread, up to this many at a time
+API_CALL_BATCH = 1024
+
+@dataclass(**_RECORD_OPTIONS)
 class APICall:
     """Structure for API call monitoring"""
     timestamp: float
@@ -25,7 +54,7 @@ class APICall:
     response_size: int
     error_message: Optional[str] = None
 
-@dataclass
+@dataclass(**_RECORD_OPTIONS)
 class SafetyViolation:
     """Structure for safety violation tracking"""
     timestamp: float
@@ -35,7 +64,7 @@ class SafetyViolation:
     description: str
     action_taken: str
 
-@dataclass
+@dataclass(**_RECORD_OPTIONS)
 class PerformanceMetrics:
     """Structure for performance metrics"""
     timestamp: float
@@ -44,17 +73,96 @@ class PerformanceMetrics:
     unit: str
     tags: Dict[str, str]
 
+@dataclass(**_RECORD_OPTIONS)
+class SafetyScan:
+    """Text verdicts from one SafetyGuard scan"""
+    pii: List[str]
+    blocked_keywords: List[str]
+
+# Python's str \s also matches \x1c-\x1f; hyperscan's does not (the PII patterns use \s only inside [...])
+_HS_SPACE = r'\t\n\x0b\x0c\r\x1c-\x1f '
+
+class SafetyGuard:
+    """
+    PII and blocked-keyword verdicts for a text. With hyperscan, one scan
+    reports which PII patterns and keywords occur; the exact PII matches are
+    only extracted when some PII pattern fired. Without hyperscan (or for
+    non-ASCII text) it runs the two regex scans.
+    """
+    
+    def __init__(self, pii_patterns, keywords, check_pii, check_keywords):
+        self._keywords = list(keywords)
+        self._pii_count = len(pii_patterns)
+        self._check_pii = check_pii
+        self._check_keywords = check_keywords
+        self._db = None
+        self._local = threading.local()  # hyperscan scratch space is per thread
+        if hyperscan is not None:
+            expressions = [p.pattern.replace(r'\s', _HS_SPACE).encode() for p in pii_patterns]
+            expressions += [re.escape(k).encode() for k in self._keywords]
+            flags = [hyperscan.HS_FLAG_SINGLEMATCH] * self._pii_count
+            flags += [hyperscan.HS_FLAG_SINGLEMATCH | hyperscan.HS_FLAG_CASELESS] * len(self._keywords)
+            self._db = hyperscan.Database()
+            self._db.compile(expressions=expressions, ids=list(range(len(expressions))),
+                             elements=len(expressions), flags=flags)
+    
+    def scan(self, text: str) -> SafetyScan:
+        # Byte patterns see the same characters as str patterns only for ASCII text
+        if self._db is None or not text.isascii():
+            return SafetyScan(pii=self._check_pii(text), blocked_keywords=self._check_keywords(text))
+        
+        scratch = getattr(self._local, 'scratch', None)
+        if scratch is None:
+            scratch = self._local.scratch = hyperscan.Scratch(self._db)
+        fired = set()
+        
+        def on_match(idx, start, end, flags, context):
+            fired.add(idx)
+        
+        self._db.scan(text.encode('ascii'), match_event_handler=on_match, scratch=scratch)
+        pii = self._check_pii(text) if any(i < self._pii_count for i in fired) else []
+        keywords = [kw for i, kw in enumerate(self._keywords, self._pii_count) if i in fired]
+        return SafetyScan(pii=pii, blocked_keywords=keywords)
+
 class NitisaraMonitor:
     """NITISARA AI Monitoring and Observability System"""
     
     def __init__(self):
-        self.api_calls = deque(maxlen=10000)  # Keep last 10k API calls
+        # Last 10k API calls as parallel columns; _call_head is the next slot to write
+        self._call_ts = np.zeros(API_CALL_CAPACITY, np.float64)
+        self._call_status = np.zeros(API_CALL_CAPACITY, np.int16)
+        self._call_rt = np.zeros(API_CALL_CAPACITY, np.float64)
+        self._call_endpoint = np.zeros(API_CALL_CAPACITY, np.int32)
+        self._call_head = 0
+        self._call_count = 0
+        self._call_lock = threading.Lock()
+        self._endpoint_ids = {}  # endpoint -> interned id
+        self._endpoint_names = []  # id -> endpoint
+        self._call_events = queue.SimpleQueue()  # request threads only put; one drainer records
         self.safety_violations = deque(maxlen=1000)  # Keep last 1k violations
         self.performance_metrics = deque(maxlen=5000)  # Keep last 5k metrics
-        self.rate_limits = defaultdict(lambda: {'count': 0, 'window_start': time.time()})
+        # Running aggregates, updated as records arrive so summaries never rescan the deques
+        self._metric_running = {}  # metric_name -> (count, sum, min, max)
+        self._violation_buckets = deque()  # [bucket_start, type counts, severity counts], oldest first
+        self._aggregate_lock = threading.Lock()
+        self.rate_limits = {}  # user_id -> GCRA theoretical arrival time (monotonic seconds)
+        self._rate_locks = [threading.Lock() for _ in range(RATE_LIMIT_SHARDS)]
         self.safety_rules = self._initialize_safety_rules()
+        self._pii_scanner = self._compile_pii_scanner()
+        self._keyword_scanner = self._compile_keyword_scanner()
+        self._guard = SafetyGuard(
+            self.safety_rules['pii_detection']['patterns'],
+            self.safety_rules['content_filtering']['blocked_keywords'],
+            self._check_pii_detection,
+            self._check_content_filtering,
+        )
         self.performance_thresholds = self._initialize_performance_thresholds()
         
+        # Rolling report snapshot, refreshed in the background for dashboard polls
+        self.report_interval = 5.0  # seconds
+        self._report_lock = threading.Lock()
+        self._report_json = None
+        
         # Setup logging
         self._setup_logging()
         
@@ -62,15 +170,21 @@ class NitisaraMonitor:
         self._start_background_monitoring()
     
     def _setup_logging(self):
-        """Setup structured logging"""
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler('nitisara_monitoring.log'),
-                logging.StreamHandler()
-            ]
-        )
+        """Setup structured logging (callers enqueue; a listener thread writes in batches)"""
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        handlers = [
+            logging.FileHandler('nitisara_monitoring.log'),
+            logging.StreamHandler()
+        ]
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        log_queue = queue.SimpleQueue()
+        self._log_listener = logging.handlers.QueueListener(log_queue, *handlers)
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        queue_handler.setFormatter(logging.Formatter('%(message)s'))  # the listener adds the prefix
+        logging.basicConfig(level=logging.INFO, handlers=[queue_handler])
+        self._log_listener.start()
+        atexit.register(self._log_listener.stop)
         self.logger = logging.getLogger('NitisaraMonitor')
     
     def _initialize_safety_rules(self) -> Dict[str, Dict]:
@@ -78,10 +192,10 @@ class NitisaraMonitor:
         return {
             'pii_detection': {
                 'enabled': True,
-                'patterns': [
-                    r'\b\d{4}[-\s]?\d{4}[-\s]?\d{4}[-\s]?\d{4}\b',  # Credit card
-                    r'\b\d{3}-\d{2}-\d{4}\b',  # SSN
-                    r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'  # Email
+                'patterns': [  # compiled once per monitor, not per request
+                    re.compile(r'\b\d{4}[-\s]?\d{4}[-\s]?\d{4}[-\s]?\d{4}\b'),  # Credit card
+                    re.compile(r'\b\d{3}-\d{2}-\d{4}\b'),  # SSN
+                    re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')  # Email
                 ],
                 'action': 'redact'
             },
@@ -128,20 +242,69 @@ class NitisaraMonitor:
             error_message=error_message
         )
         
-        self.api_calls.append(api_call)
-        
-        # Log to file
-        self.logger.info(f"API Call: {method} {endpoint} - {status_code} - {response_time:.3f}s")
-        
-        # Check for performance issues
-        self._check_performance_thresholds(api_call)
+        # Recording, logging and threshold checks happen on the api-call drainer thread
+        self._call_events.put(api_call)
+    
+    def _drain_api_calls(self):
+        """Record queued API calls in batches (the ring buffer's only writer)"""
+        while True:
+            batch = [self._call_events.get()]
+            try:
+                while len(batch) < API_CALL_BATCH:
+                    batch.append(self._call_events.get_nowait())
+            except queue.Empty:
+                pass
+            try:
+                self._record_api_calls(batch)
+                for api_call in batch:
+                    # Log to file
+                    self.logger.info(f"API Call: {api_call.method} {api_call.endpoint} - "
+                                     f"{api_call.status_code} - {api_call.response_time:.3f}s")
+                    # Check for performance issues
+                    self._check_performance_thresholds(api_call)
+            except Exception as e:
+                self.logger.error(f"API call recording error: {e}")
+    
+    def _record_api_calls(self, api_calls: List[APICall]):
+        """Write each call's numeric fields into the next ring-buffer slots"""
+        with self._call_lock:
+            for api_call in api_calls:
+                endpoint_id = self._endpoint_ids.get(api_call.endpoint)
+                if endpoint_id is None:
+                    endpoint_id = self._endpoint_ids[api_call.endpoint] = len(self._endpoint_names)
+                    self._endpoint_names.append(api_call.endpoint)
+                i = self._call_head
+                self._call_ts[i] = api_call.timestamp
+                self._call_status[i] = api_call.status_code
+                self._call_rt[i] = api_call.response_time
+                self._call_endpoint[i] = endpoint_id
+                self._call_head = (i + 1) % API_CALL_CAPACITY
+            self._call_count = min(self._call_count + len(api_calls), API_CALL_CAPACITY)
+    
+    def _recent_calls(self, last: Optional[int] = None):
+        """Copies of the (timestamp, status, response_time, endpoint_id) columns, oldest first"""
+        with self._call_lock:
+            n = self._call_count if last is None else min(last, self._call_count)
+            idx = np.arange(self._call_head - n, self._call_head) % API_CALL_CAPACITY
+            return self._call_ts[idx], self._call_status[idx], self._call_rt[idx], self._call_endpoint[idx]
+    
+    def _scan_window(self, cutoff: Optional[float] = None, last: Optional[int] = None) -> tuple:
+        """One filter over recent calls: (total, errors, rt_sum, rt_max, endpoint_ids)"""
+        ts, status, rt, endpoints = self._recent_calls(last)
+        if cutoff is not None:
+            mask = ts >= cutoff
+            status, rt, endpoints = status[mask], rt[mask], endpoints[mask]
+        if not rt.size:
+            return 0, 0, 0.0, 0.0, endpoints
+        return int(rt.size), int(np.count_nonzero(status >= 400)), float(rt.sum()), float(rt.max()), endpoints
     
     def check_safety_violations(self, user_input: str, user_id: str) -> List[SafetyViolation]:
         """Check for safety violations in user input"""
         violations = []
+        scan = self._guard.scan(user_input)  # PII and blocked keywords in one pass
         
         # Check for PII
-        pii_violations = self._check_pii_detection(user_input)
+        pii_violations = scan.pii
         if pii_violations:
             violations.append(SafetyViolation(
                 timestamp=time.time(),
@@ -153,7 +316,7 @@ class NitisaraMonitor:
             ))
         
         # Check for blocked keywords
-        content_violations = self._check_content_filtering(user_input)
+        content_violations = scan.blocked_keywords
         if content_violations:
             violations.append(SafetyViolation(
                 timestamp=time.time(),
@@ -177,51 +340,60 @@ class NitisaraMonitor:
             ))
         
         # Log violations
+        if violations:
+            self._count_violations(violations)
         for violation in violations:
             self.safety_violations.append(violation)
             self.logger.warning(f"Safety Violation: {violation.violation_type} - {violation.description}")
         
         return violations
     
+    def _compile_pii_scanner(self):
+        """Fuse the PII patterns into one alternation (group p<i> = pattern i)"""
+        patterns = self.safety_rules['pii_detection']['patterns']
+        return re.compile('|'.join(f'(?P<p{i}>{p.pattern})' for i, p in enumerate(patterns)))
+    
+    def _compile_keyword_scanner(self):
+        """One pass for every blocked keyword; the lookahead also reports overlapping hits"""
+        keywords = self.safety_rules['content_filtering']['blocked_keywords']
+        return re.compile(
+            '(?=(' + '|'.join(re.escape(k) for k in sorted(keywords, key=len, reverse=True)) + '))'
+        )
+    
     def _check_pii_detection(self, text: str) -> List[str]:
-        """Check for PII in text"""
-        violations = []
-        import re
+        """Check for PII in text (all patterns in a single scan)"""
+        # Cheap C-level gate: plain prose skips the regex scan entirely
+        if '@' not in text and not _DIGIT_RE.search(text):
+            return []
         
-        for pattern in self.safety_rules['pii_detection']['patterns']:
-            matches = re.findall(pattern, text)
-            if matches:
-                violations.extend(matches)
+        found = [[] for _ in self.safety_rules['pii_detection']['patterns']]
+        for match in self._pii_scanner.finditer(text):
+            found[int(match.lastgroup[1:])].append(match.group())
         
-        return violations
+        # Reported grouped by pattern, as before
+        return [hit for hits in found for hit in hits]
     
     def _check_content_filtering(self, text: str) -> List[str]:
         """Check for blocked content"""
-        violations = []
-        text_lower = text.lower()
-        
-        for keyword in self.safety_rules['content_filtering']['blocked_keywords']:
-            if keyword in text_lower:
-                violations.append(keyword)
+        hits = set(self._keyword_scanner.findall(text.lower()))
+        if not hits:
+            return []
         
-        return violations
+        # Same order as the rule list, each keyword once
+        return [kw for kw in self.safety_rules['content_filtering']['blocked_keywords'] if kw in hits]
     
     def _check_rate_limiting(self, user_id: str) -> bool:
-        """Check if user has exceeded rate limits"""
-        current_time = time.time()
-        user_limits = self.rate_limits[user_id]
-        
-        # Reset window if needed
-        if current_time - user_limits['window_start'] > 3600:  # 1 hour
-            user_limits['count'] = 0
-            user_limits['window_start'] = current_time
-        
-        # Check limits
+        """Check if user has exceeded rate limits (GCRA: one float per user)"""
         max_per_hour = self.safety_rules['rate_limiting']['max_requests_per_hour']
-        if user_limits['count'] >= max_per_hour:
-            return True
-        
-        user_limits['count'] += 1
+        interval = 3600 / max_per_hour  # seconds each request "costs"
+        burst = 3600 - interval  # a full hour's quota may arrive at once
+        now = time.monotonic()
+        
+        with self._rate_locks[hash(user_id) % RATE_LIMIT_SHARDS]:
+            tat = max(self.rate_limits.get(user_id, now), now)
+            if tat - now > burst:
+                return True
+            self.rate_limits[user_id] = tat + interval
         return False
     
     def _check_performance_thresholds(self, api_call: APICall):
@@ -245,28 +417,44 @@ class NitisaraMonitor:
         )
         
         self.performance_metrics.append(metric)
+        with self._aggregate_lock:
+            count, total, low, high = self._metric_running.get(metric_name, (0, 0.0, value, value))
+            self._metric_running[metric_name] = (count + 1, total + value, min(low, value), max(high, value))
         self.logger.info(f"Performance Metric: {metric_name}={value} {unit}")
     
+    def _count_violations(self, violations: List[SafetyViolation]):
+        """Add violations to the current per-minute bucket, dropping buckets past retention"""
+        now = time.time()
+        bucket_start = now - now % SAFETY_BUCKET_SECONDS
+        with self._aggregate_lock:
+            buckets = self._violation_buckets
+            if not buckets or buckets[-1][0] != bucket_start:
+                buckets.append([bucket_start, defaultdict(int), defaultdict(int)])
+            _, types, severities = buckets[-1]
+            for violation in violations:
+                types[violation.violation_type] += 1
+                severities[violation.severity] += 1
+            while buckets and buckets[0][0] < now - SAFETY_BUCKET_RETENTION:
+                buckets.popleft()
+    
     def get_api_metrics(self, time_window: int = 3600) -> Dict[str, Any]:
         """Get API metrics for specified time window"""
         cutoff_time = time.time() - time_window
-        recent_calls = [call for call in self.api_calls if call.timestamp >= cutoff_time]
+        total_calls, errors, rt_sum, max_response_time, endpoints = self._scan_window(cutoff=cutoff_time)
         
-        if not recent_calls:
+        if not total_calls:
             return {'error': 'No data in time window'}
         
         # Calculate metrics
-        total_calls = len(recent_calls)
-        successful_calls = len([call for call in recent_calls if call.status_code < 400])
-        error_rate = (total_calls - successful_calls) / total_calls if total_calls > 0 else 0
-        
-        avg_response_time = sum(call.response_time for call in recent_calls) / total_calls
-        max_response_time = max(call.response_time for call in recent_calls)
+        successful_calls = total_calls - errors
+        error_rate = errors / total_calls
+        avg_response_time = rt_sum / total_calls
         
         # Endpoint breakdown
-        endpoint_counts = defaultdict(int)
-        for call in recent_calls:
-            endpoint_counts[call.endpoint] += 1
+        endpoint_ids, counts = np.unique(endpoints, return_counts=True)
+        endpoint_counts = {
+            self._endpoint_names[i]: c for i, c in zip(endpoint_ids.tolist(), counts.tolist())
+        }
         
         return {
             'total_calls': total_calls,
@@ -274,48 +462,48 @@ class NitisaraMonitor:
             'error_rate': error_rate,
             'avg_response_time': avg_response_time,
             'max_response_time': max_response_time,
-            'endpoint_breakdown': dict(endpoint_counts)
+            'endpoint_breakdown': endpoint_counts
         }
     
     def get_safety_metrics(self, time_window: int = 3600) -> Dict[str, Any]:
-        """Get safety metrics for specified time window"""
+        """Get safety metrics for specified time window (minute resolution)"""
         cutoff_time = time.time() - time_window
-        recent_violations = [v for v in self.safety_violations if v.timestamp >= cutoff_time]
-        
-        if not recent_violations:
-            return {'total_violations': 0, 'violation_types': {}}
         
-        # Count violations by type
+        # Count violations by type, summing the per-minute buckets that overlap the window
         violation_types = defaultdict(int)
         severity_counts = defaultdict(int)
-        
-        for violation in recent_violations:
-            violation_types[violation.violation_type] += 1
-            severity_counts[violation.severity] += 1
+        with self._aggregate_lock:
+            for bucket_start, types, severities in reversed(self._violation_buckets):
+                if bucket_start + SAFETY_BUCKET_SECONDS <= cutoff_time:
+                    break
+                for name, count in types.items():
+                    violation_types[name] += count
+                for name, count in severities.items():
+                    severity_counts[name] += count
+        
+        if not violation_types:
+            return {'total_violations': 0, 'violation_types': {}}
         
         return {
-            'total_violations': len(recent_violations),
+            'total_violations': sum(violation_types.values()),
             'violation_types': dict(violation_types),
             'severity_breakdown': dict(severity_counts)
         }
     
     def get_performance_summary(self) -> Dict[str, Any]:
         """Get overall performance summary"""
-        if not self.performance_metrics:
+        with self._aggregate_lock:
+            running = dict(self._metric_running)
+        if not running:
             return {'error': 'No performance data available'}
         
-        # Group metrics by name
-        metric_groups = defaultdict(list)
-        for metric in self.performance_metrics:
-            metric_groups[metric.metric_name].append(metric.value)
-        
         summary = {}
-        for metric_name, values in metric_groups.items():
+        for metric_name, (count, total, low, high) in running.items():
             summary[metric_name] = {
-                'count': len(values),
-                'avg': sum(values) / len(values),
-                'min': min(values),
-                'max': max(values)
+                'count': count,
+                'avg': total / count,
+                'min': low,
+                'max': high
             }
         
         return summary
@@ -337,19 +525,33 @@ class NitisaraMonitor:
         
         monitor_thread = threading.Thread(target=monitor_loop, daemon=True)
         monitor_thread.start()
+        
+        drain_thread = threading.Thread(target=self._drain_api_calls, name="monitoring-api-calls", daemon=True)
+        drain_thread.start()
+
+        def snapshot_loop():
+            while True:
+                try:
+                    self.refresh_report_snapshot()
+                except Exception as e:
+                    self.logger.error(f"Report snapshot error: {e}")
+                time.sleep(self.report_interval)
+        
+        snapshot_thread = threading.Thread(target=snapshot_loop, name="monitoring-snapshot", daemon=True)
+        snapshot_thread.start()
     
     def _check_system_health(self):
         """Check overall system health"""
         # Check API call patterns
-        recent_calls = list(self.api_calls)[-100:]  # Last 100 calls
-        if recent_calls:
-            error_rate = len([call for call in recent_calls if call.status_code >= 400]) / len(recent_calls)
+        total, errors, _, _, _ = self._scan_window(last=100)  # Last 100 calls
+        if total:
+            error_rate = errors / total
             if error_rate > self.performance_thresholds['max_error_rate']:
                 self.logger.warning(f"High error rate detected: {error_rate:.2%}")
     
     def _cleanup_old_data(self):
         """Clean up old monitoring data"""
-        # This is handled by deque maxlen, but we can add additional cleanup here
+        # This is handled by the ring buffer and deque maxlen, but we can add additional cleanup here
         pass
     
     def generate_monitoring_report(self) -> Dict[str, Any]:
@@ -362,15 +564,28 @@ class NitisaraMonitor:
             'system_health': 'HEALTHY' if self._is_system_healthy() else 'DEGRADED'
         }
     
+    def refresh_report_snapshot(self) -> bytes:
+        """Rebuild the report and store it pre-serialized as JSON"""
+        payload = orjson.dumps(self.generate_monitoring_report())
+        with self._report_lock:
+            self._report_json = payload
+        return payload
+    
+    def get_report_snapshot(self) -> bytes:
+        """Latest report as JSON bytes (at most report_interval seconds old)"""
+        with self._report_lock:
+            payload = self._report_json
+        return payload if payload is not None else self.refresh_report_snapshot()
+    
     def _is_system_healthy(self) -> bool:
         """Check if system is healthy"""
         # Simple health check based on recent performance
-        recent_calls = list(self.api_calls)[-50:]  # Last 50 calls
-        if not recent_calls:
+        total, errors, rt_sum, _, _ = self._scan_window(last=50)  # Last 50 calls
+        if not total:
             return True
         
-        error_rate = len([call for call in recent_calls if call.status_code >= 400]) / len(recent_calls)
-        avg_response_time = sum(call.response_time for call in recent_calls) / len(recent_calls)
+        error_rate = errors / total
+        avg_response_time = rt_sum / total
         
         return (error_rate < self.performance_thresholds['max_error_rate'] and 
                 avg_response_time < self.performance_thresholds['max_response_time'])
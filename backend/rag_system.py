@@ -5,9 +5,51 @@ Retrieval Augmented Generation for trade compliance, documentation, and logistic
 
 import json
 import re
+import time
+import hashlib
+import logging
+import threading
+import importlib.util
+from collections import OrderedDict
 from typing import List, Dict, Any, Tuple
 from dataclasses import dataclass
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import linear_kernel
 from gemini_chain import get_llm_response
+from embedder import get_embedder, embed
+
+# Fixed opening of every RAG prompt (identical bytes across requests)
+_RAG_PROMPT_PREFIX = """
+        You are Captain, NITISARA's AI logistics assistant. Use the following knowledge base information to answer the user's question accurately and comprehensively.
+        
+        Instructions:
+        1. Answer based on the knowledge base information provided
+        2. If information is not available in the knowledge base, say so clearly
+        3. Provide specific, actionable information
+        4. Cite relevant sources when possible
+        5. Maintain professional tone appropriate for logistics business
+        """
+
+# Reply cache: queries that normalize to the same words reuse the LLM answer
+RESPONSE_CACHE_SIZE = 512
+RESPONSE_CACHE_TTL = 600  # seconds
+_WORD_RE = re.compile(r'\w+')
+
+# Dense retrieval shares the MiniLM model (embedder.py) with the FAISS stores in
+# foundational_config; TF-IDF is the fallback when the model or FAISS cannot be loaded
+DENSE_THRESHOLD = 0.3  # minimum embedding cosine similarity
+DENSE_RERANK_FACTOR = 4  # int8 candidates per requested result, re-scored exactly in float32
+TFIDF_THRESHOLD = 0.1  # minimum TF-IDF cosine similarity
+_HAS_FAISS = importlib.util.find_spec("faiss") is not None
+
+logger = logging.getLogger(__name__)
+
+def _get_embedder():
+    """The shared sentence-transformer; None if it or FAISS is unavailable"""
+    if not _HAS_FAISS:
+        return None
+    return get_embedder()
 
 @dataclass
 class Document:
@@ -19,13 +61,44 @@ class Document:
     tags: List[str]
     relevance_score: float = 0.0
 
+def _document_text(doc: Document) -> str:
+    """Text indexed for retrieval: title, content, tags and category"""
+    return f"{doc.title} {doc.content} {' '.join(doc.tags)} {doc.category}"
+
 class NitisaraRAG:
     """NITISARA RAG System for logistics knowledge retrieval"""
     
     def __init__(self):
         self.knowledge_base = self._initialize_knowledge_base()
-        self.vector_embeddings = {}  # Simplified vector storage
-        self.retrieval_threshold = 0.7
+        self.retrieval_threshold = TFIDF_THRESHOLD  # set by _build_index for the active retriever
+        self._index_lock = threading.Lock()
+        self._build_index()
+        self._response_cache = OrderedDict()  # key -> (expires_at, response), LRU order
+        self._cache_lock = threading.Lock()
+    
+    def _cache_key(self, query: str, documents: List[Document], context_text: str) -> str:
+        """Hash of the query's words (ignoring case, spacing and punctuation), the retrieved doc ids and the context"""
+        normalized = " ".join(_WORD_RE.findall(query.lower()))
+        doc_ids = ",".join(doc.id for doc in documents)
+        return hashlib.blake2b(f"{doc_ids}|{normalized}|{context_text}".encode("utf-8"), digest_size=16).hexdigest()
+    
+    def _cached_response(self, key: str):
+        with self._cache_lock:
+            entry = self._response_cache.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._response_cache[key]
+                return None
+            self._response_cache.move_to_end(key)
+            return entry[1]
+    
+    def _store_response(self, key: str, response: str):
+        with self._cache_lock:
+            self._response_cache[key] = (time.monotonic() + RESPONSE_CACHE_TTL, response)
+            self._response_cache.move_to_end(key)
+            if len(self._response_cache) > RESPONSE_CACHE_SIZE:
+                self._response_cache.popitem(last=False)
     
     def _initialize_knowledge_base(self) -> List[Document]:
         """Initialize knowledge base with trade compliance and logistics information"""
@@ -89,53 +162,74 @@ class NitisaraRAG:
         ]
         return documents
     
-    def retrieve_relevant_documents(self, query: str, category: str = None, limit: int = 5) -> List[Document]:
-        """Retrieve relevant documents based on query"""
-        query_lower = query.lower()
-        relevant_docs = []
-        
-        for doc in self.knowledge_base:
-            # Filter by category if specified
-            if category and doc.category != category:
-                continue
+    def _build_index(self):
+        """Embed and index the knowledge base (TF-IDF too); readers swap to the new index atomically"""
+        with self._index_lock:
+            docs = list(self.knowledge_base)
+            texts = [_document_text(doc) for doc in docs]
+            vectorizer = TfidfVectorizer(stop_words="english")
+            matrix = vectorizer.fit_transform(texts)
+            categories = np.array([doc.category for doc in docs])
             
-            # Calculate relevance score
-            relevance_score = self._calculate_relevance_score(query_lower, doc)
+            dense = None
+            embedder = _get_embedder()
+            if embedder is not None:
+                import faiss
+                embeddings = embed(embedder, texts)
+                # int8 codes: 4x smaller than float32 and scanned with integer dot products
+                index = faiss.IndexScalarQuantizer(
+                    embeddings.shape[1], faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+                )
+                index.train(embeddings)
+                index.add(embeddings)
+                dense = (index, embeddings)
             
-            if relevance_score >= self.retrieval_threshold:
-                doc.relevance_score = relevance_score
-                relevant_docs.append(doc)
-        
-        # Sort by relevance score and return top results
-        relevant_docs.sort(key=lambda x: x.relevance_score, reverse=True)
-        return relevant_docs[:limit]
+            # Prompt text per document, rendered once instead of on every request
+            self._doc_blocks = {doc.id: self._document_block(doc) for doc in docs}
+            threshold = DENSE_THRESHOLD if dense is not None else TFIDF_THRESHOLD
+            self._index = (docs, categories, vectorizer, matrix, dense, threshold)
+            self.retrieval_threshold = threshold
     
-    def _calculate_relevance_score(self, query: str, doc: Document) -> float:
-        """Calculate relevance score between query and document"""
-        score = 0.0
-        
-        # Title matching
-        if any(word in doc.title.lower() for word in query.split()):
-            score += 0.3
-        
-        # Content matching
-        content_words = doc.content.lower().split()
-        query_words = query.split()
-        
-        for query_word in query_words:
-            if query_word in content_words:
-                score += 0.2
-        
-        # Tag matching
-        for tag in doc.tags:
-            if tag in query:
-                score += 0.1
+    def _dense_search(self, dense, query: str, categories, category: str, limit: int):
+        """(doc index, score) pairs from the int8 index, re-ranked by exact float32 cosine, best first"""
+        index, embeddings = dense
+        query_vec = embed(_get_embedder(), [query])
+        # Category filters after search, so it has to see every vector
+        k = index.ntotal if category else min(limit * DENSE_RERANK_FACTOR, index.ntotal)
+        _, ids = index.search(query_vec, k)
+        ids = ids[0][ids[0] >= 0]
+        if category:
+            ids = ids[categories[ids] == category]
+        scores = embeddings[ids] @ query_vec[0]
+        order = np.argsort(-scores, kind="stable")
+        return list(zip(ids[order].tolist(), scores[order].tolist()))
+    
+    def _lexical_search(self, vectorizer, matrix, query: str, categories, category: str, threshold: float, limit: int):
+        """(doc index, score) pairs by TF-IDF cosine, best first (ties keep knowledge-base order)"""
+        scores = linear_kernel(vectorizer.transform([query]), matrix).ravel()
+        if category:
+            scores[categories != category] = 0.0
+        candidates = np.flatnonzero(scores >= threshold)
+        top = candidates[np.argsort(-scores[candidates], kind="stable")[:limit]]
+        return list(zip(top.tolist(), scores[top].tolist()))
+    
+    def retrieve_relevant_documents(self, query: str, category: str = None, limit: int = 5) -> List[Document]:
+        """Retrieve relevant documents based on query"""
+        docs, categories, vectorizer, matrix, dense, threshold = self._index
         
-        # Category matching
-        if doc.category in query:
-            score += 0.2
+        if dense is not None:
+            ranked = self._dense_search(dense, query, categories, category, limit)
+        else:
+            ranked = self._lexical_search(vectorizer, matrix, query, categories, category, threshold, limit)
         
-        return min(score, 1.0)
+        relevant_docs = []
+        for i, score in ranked:
+            if score < threshold or len(relevant_docs) == limit:
+                break
+            doc = docs[i]
+            doc.relevance_score = float(score)
+            relevant_docs.append(doc)
+        return relevant_docs
     
     def generate_rag_response(self, user_query: str, context: Dict = None) -> str:
         """Generate response using RAG system"""
@@ -145,49 +239,52 @@ class NitisaraRAG:
         if not relevant_docs:
             return "I don't have specific information about that topic. Please provide more details or try a different query."
         
+        # Repeated questions over the same documents skip the LLM call
+        # Context keys in a fixed order, so equal contexts give the same prompt and key
+        extra_context = str(dict(sorted(context.items()))) if context else 'No additional context'
+        cache_key = self._cache_key(user_query, relevant_docs, extra_context)
+        cached = self._cached_response(cache_key)
+        if cached is not None:
+            return cached
+        
         # Build context from retrieved documents
         context_text = self._build_context_from_documents(relevant_docs)
         
-        # Generate response using LLM with retrieved context
-        rag_prompt = f"""
-        You are Captain, NITISARA's AI logistics assistant. Use the following knowledge base information to answer the user's question accurately and comprehensively.
-        
+        # Static instructions first, then documents in a fixed order, then the
+        # per-request parts, so repeated chunks share a prompt prefix that the
+        # model server can reuse from its prefix cache
+        rag_prompt = f"""{_RAG_PROMPT_PREFIX}
         KNOWLEDGE BASE CONTEXT:
         {context_text}
         
         USER QUESTION: {user_query}
         
-        ADDITIONAL CONTEXT: {context or 'No additional context'}
-        
-        Instructions:
-        1. Answer based on the knowledge base information provided
-        2. If information is not available in the knowledge base, say so clearly
-        3. Provide specific, actionable information
-        4. Cite relevant sources when possible
-        5. Maintain professional tone appropriate for logistics business
+        ADDITIONAL CONTEXT: {extra_context}
         
         Response:
         """
         
         try:
             response = get_llm_response(rag_prompt)
+            self._store_response(cache_key, response)
             return response
         except Exception as e:
             return f"I encountered an error while processing your request: {str(e)}. Please try again."
     
     def _build_context_from_documents(self, documents: List[Document]) -> str:
-        """Build context string from retrieved documents"""
-        context_parts = []
-        
-        for i, doc in enumerate(documents, 1):
-            context_parts.append(f"""
-Document {i}: {doc.title}
+        """Build context string from retrieved documents, ordered by id so shared chunks line up"""
+        blocks = self._doc_blocks
+        return "\n".join(
+            blocks.get(doc.id) or self._document_block(doc) for doc in sorted(documents, key=lambda d: d.id)
+        )
+    
+    def _document_block(self, doc: Document) -> str:
+        """Prompt text for one document; identical on every request that retrieves it"""
+        return f"""
+Document {doc.id}: {doc.title}
 Category: {doc.category}
 Content: {doc.content}
-Relevance Score: {doc.relevance_score:.2f}
-""")
-        
-        return "\n".join(context_parts)
+"""
     
     def add_document(self, title: str, content: str, category: str, tags: List[str]) -> str:
         """Add new document to knowledge base"""
@@ -200,6 +297,10 @@ Relevance Score: {doc.relevance_score:.2f}
             tags=tags
         )
         self.knowledge_base.append(new_doc)
+        self._build_index()
+        # Cached answers may not reflect the new document
+        with self._cache_lock:
+            self._response_cache.clear()
         return doc_id
     
     def search_knowledge_base(self, query: str, category: str = None) -> List[Dict[str, Any]]:
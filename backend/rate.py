@@ -1,4 +1,41 @@
-import re
+import numpy as np
+
+# Tariff constants (₹, and kg CO₂e per kg·km), shared by the single and batch quotes
+BASE_SEA = 15000
+SEA_PER_KG = 25
+SEA_PER_KM = 1.2
+EXPRESS_SEA_FACTOR = 1.15
+BASE_AIR = 45000
+AIR_PER_KG = 180
+AIR_PER_KM = 4.5
+CO2_SEA_PER_KG_KM = 0.000015
+CO2_AIR_PER_KG_KM = 0.000285
+DEFAULT_WEIGHT = 500
+DEFAULT_DISTANCE_KM = 5000
+
+
+def _rate_components(weight, distance_km):
+    """Costs and emissions; works on floats or (broadcast) NumPy arrays alike."""
+    sea_cost = BASE_SEA + (weight * SEA_PER_KG) + (distance_km * SEA_PER_KM)
+    return {
+        "sea": sea_cost,
+        "sea_fast": sea_cost * EXPRESS_SEA_FACTOR,
+        "air": BASE_AIR + (weight * AIR_PER_KG) + (distance_km * AIR_PER_KM),
+        "co2_sea": (weight * distance_km * CO2_SEA_PER_KG_KM) / 1000,  # tonnes
+        "co2_air": (weight * distance_km * CO2_AIR_PER_KG_KM) / 1000,  # tonnes
+    }
+
+
+def estimate_rates(weights, distances):
+    """
+    Batch quotes: arrays of weights (kg) and distances (km) in, arrays of
+    sea / sea_fast / air costs and co2_sea / co2_air tonnes out, computed in
+    one vectorized pass (e.g. for every row of an uploaded CSV).
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    distances = np.asarray(distances, dtype=np.float64)
+    return _rate_components(weights, distances)
+
 
 def estimate_rate(details):
     """
@@ -7,29 +44,19 @@ def estimate_rate(details):
     """
     origin = details.get('origin', 'Unknown')
     destination = details.get('destination', 'Unknown')
-    cargo_desc = details.get('cargo', 'General cargo')
     
     # 1. Get Precision Data
-    weight = float(details.get('weight', 500))
+    weight = float(details.get('weight', DEFAULT_WEIGHT))
     
     # ✅ USE REAL DISTANCE (with fallback just in case)
     distance_km = details.get('distance_km')
     if not distance_km:
-        distance_km = 5000 # Should ideally not happen with new Agent logic
-
-    # 2. Calculate Totals
-    # Sea Rates
-    base_sea = 15000
-    sea_cost = base_sea + (weight * 25) + (distance_km * 1.2)
-    sea_fast = sea_cost * 1.15
-    
-    # Air Rates
-    base_air = 45000
-    air_cost = base_air + (weight * 180) + (distance_km * 4.5)
+        distance_km = DEFAULT_DISTANCE_KM # Should ideally not happen with new Agent logic
 
-    # Emissions
-    co2_sea = (weight * distance_km * 0.000015) / 1000 # tonnes
-    co2_air = (weight * distance_km * 0.000285) / 1000 # tonnes
+    # 2. Calculate Totals (sea, express sea, air, and emissions in tonnes)
+    rates = _rate_components(weight, distance_km)
+    sea_cost, sea_fast, air_cost = rates["sea"], rates["sea_fast"], rates["air"]
+    co2_sea, co2_air = rates["co2_sea"], rates["co2_air"]
 
     route = f"{origin} → {destination}"
     
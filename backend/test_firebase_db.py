@@ -0,0 +1,100 @@
+import threading
+import time
+
+import pytest
+
+import firebase_db
+
+
+def _wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "background write did not land"
+        time.sleep(0.01)
+
+
+def _turn_writes_landed(user):
+    entry = firebase_db._HISTORY_CACHE.get(user)
+    return entry is None or not entry[2]
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """firebase_db in local-JSON mode, with its files and caches isolated in tmp_path."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(firebase_db.firebase_admin, "_apps", {})
+    monkeypatch.setattr(firebase_db, "_LOCAL_CACHE", None)
+    monkeypatch.setattr(firebase_db, "_LOCAL_VERSION", None)
+    monkeypatch.setattr(firebase_db, "_DIRTY_KEYS", set())
+    for name in ("_LOCAL_STATE", "_HISTORY_CACHE", "_MESSAGES_CACHE"):
+        monkeypatch.setattr(firebase_db, name, type(getattr(firebase_db, name))())
+    monkeypatch.setattr(firebase_db, "_STATE_STAMPS", {})
+    yield firebase_db
+    _wait_until(lambda: all(not entry[2] for entry in firebase_db._HISTORY_CACHE.values()))
+    firebase_db._flush()  # before the working directory is restored
+
+
+def test_commit_turn_then_recent_messages_keeps_order(db, monkeypatch):
+    monkeypatch.setattr(db, "HISTORY_TTL", 0.05)
+    db.get_recent_messages("alice")  # as process_conversation does before each turn
+    db.commit_turn("alice", {"step": "conversation"}, [("user", "hi"), ("captain", "hello")])
+    db.commit_turn("alice", {"step": "quote"}, [("user", "rate?"), ("captain", "₹100")])
+    expected = ["hi", "hello", "rate?", "₹100"]
+
+    # Served from the window while the writes are still in flight
+    assert [m["content"] for m in db.get_recent_messages("alice")] == expected
+    assert db.get_state("alice") == {"step": "quote"}
+
+    # Once both writes land and the window expires, the refetch agrees
+    _wait_until(lambda: _turn_writes_landed("alice"))
+    time.sleep(0.06)
+    db._append_local_messages("alice", [{"role": "user", "content": "next"}])  # only a refetch sees this
+    expected.append("next")
+    assert [m["content"] for m in db.get_recent_messages("alice")] == expected
+    assert [m["content"] for m in db.get_messages("alice").values()] == expected
+
+
+def test_persist_turn_skips_superseded_state(db):
+    old_stamp, new_stamp = 1, 2
+    db._cache_state("bob", {"step": "new"}, new_stamp)
+    entries = [{"role": "user", "content": "late"}]
+
+    db._persist_turn("bob", {"step": "old"}, {}, entries, old_stamp)
+
+    # The older turn's messages are written, its state is not
+    assert "bob_state" not in db._load_local_db()
+    assert [m["content"] for m in db._iter_local_messages("bob")] == ["late"]
+    assert db.get_state("bob") == {"step": "new"}
+
+    db._persist_turn("bob", {"step": "new"}, {}, [], new_stamp)
+    assert db._load_local_db()["bob_state"] == {"step": "new"}
+    assert "bob" not in db._STATE_STAMPS
+
+
+def test_history_window_expires_after_ttl(db, monkeypatch):
+    monkeypatch.setattr(db, "HISTORY_TTL", 0.05)
+    assert db.get_recent_messages("carol") == []
+
+    # Written by another server process: not visible until the window expires
+    db._append_local_messages("carol", [{"role": "user", "content": "from elsewhere"}])
+    assert db.get_recent_messages("carol") == []
+
+    time.sleep(0.06)
+    assert [m["content"] for m in db.get_recent_messages("carol")] == ["from elsewhere"]
+
+
+def test_next_order_sequence_is_monotonic_and_unique(db):
+    assert [db.next_order_sequence() for _ in range(5)] == [1, 2, 3, 4, 5]
+
+    seqs = []
+    workers = [
+        threading.Thread(target=lambda: seqs.extend(db.next_order_sequence() for _ in range(50)))
+        for _ in range(4)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert sorted(seqs) == list(range(6, 206))
+    assert db._read_local_file()["NTS_SEQ"] == 205
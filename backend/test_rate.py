@@ -0,0 +1,26 @@
+import re
+
+from rate import AIR_PER_KG, estimate_rate, estimate_rates
+
+
+def _quoted_costs(quote):
+    # "₹15,250" -> 15250.0 for the sea, express sea and air lines, in order
+    return [float(m.replace(",", "")) for m in re.findall(r"₹([\d,]+)", quote)]
+
+
+def test_batch_rates_match_single_quotes():
+    weights = [1, 500, 2_400.5, 18_000]
+    distances = [120, 5_000, 8_763, 16_020]
+    rates = estimate_rates(weights, distances)
+    for i, (weight, distance_km) in enumerate(zip(weights, distances)):
+        quote = estimate_rate({"weight": weight, "distance_km": distance_km})
+        expected = [round(float(rates[key][i])) for key in ("sea", "sea_fast", "air")]
+        assert _quoted_costs(quote) == expected
+        assert f"{rates['co2_sea'][i]:.2f}t" in quote
+        assert f"{rates['co2_air'][i]:.2f}t" in quote
+
+
+def test_batch_rates_broadcast_a_single_distance():
+    rates = estimate_rates([100, 200], 1_000)
+    assert rates["air"].shape == (2,)
+    assert rates["air"][1] - rates["air"][0] == 100 * AIR_PER_KG
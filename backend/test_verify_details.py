@@ -0,0 +1,16 @@
+from compliance.verify_details import extract_key_fields, extract_key_fields_from_pages
+
+
+def test_value_on_next_page_is_not_cut_off():
+    # "Product -" ends page 1; the product name only follows on page 2
+    pages = ["x" * 500 + " HSN Code: 74081100\nWeight: 20 kg\nProduct -\n", "Copper wire\nShipper ABC\n"]
+    _, fields = extract_key_fields_from_pages(pages, min_chars=500)
+    assert fields == extract_key_fields("".join(pages).strip())
+    assert fields["product_name"].startswith("Copper wire")
+
+
+def test_whitespace_page_does_not_settle_matches():
+    pages = ["HSN Code: 74081100 Weight: 20 kg. Product -", "\n", "Copper wire"]
+    _, fields = extract_key_fields_from_pages(pages)
+    assert fields == extract_key_fields("".join(pages).strip())
+
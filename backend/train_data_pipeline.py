@@ -5,16 +5,23 @@ Trains FAISS vector databases from internal CSV datasets.
 """
 
 import os
-from langchain_community.document_loaders import CSVLoader
+import csv
+import math
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+import faiss
+import numpy as np
+from langchain_core.documents import Document
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores.utils import DistanceStrategy
 from langchain_community.embeddings import HuggingFaceEmbeddings
-from dotenv import load_dotenv
+from config import GOOGLE_API_KEY
 
 # ==========================================================
 # 1️⃣ Environment Setup
 # ==========================================================
-load_dotenv()
-api_key = os.getenv("GOOGLE_API_KEY")
+api_key = GOOGLE_API_KEY  # .env is loaded once in config.py
 if not api_key:
     raise ValueError("⚠️ GOOGLE_API_KEY not found in .env file")
 
@@ -25,12 +32,214 @@ DATA_FOLDER = "data"
 VECTOR_FOLDER = "vector_dbs"
 os.makedirs(VECTOR_FOLDER, exist_ok=True)
 
-embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+# Embed on the GPU when there is one; rows are encoded in batches either way
+EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+
+
+def _embedding_device():
+    device = os.getenv("EMBED_DEVICE")
+    if device:
+        return device
+    try:
+        import torch
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    except ImportError:
+        return "cpu"
+
+
+# fp16 weights on CUDA (EMBED_FP16=0 keeps fp32); kept only if vectors match fp32
+EMBED_FP16 = os.getenv("EMBED_FP16", "1") != "0"
+FP16_MIN_COSINE = 0.999
+_FP16_PROBE = "company_name: Nitisara Logistics\nincoterms: CIF\nweight_kg: 1200"
+
+
+def _use_fp16(model):
+    """Switch the model to half precision unless that moves a probe vector noticeably."""
+    reference = model.encode([_FP16_PROBE], normalize_embeddings=True)[0].astype(np.float32)
+    model.half()
+    try:
+        halved = model.encode([_FP16_PROBE], normalize_embeddings=True)[0].astype(np.float32)
+        if float(np.dot(reference, halved)) >= FP16_MIN_COSINE:
+            print("⚡ Embedding in fp16 on the GPU")
+            return
+    except Exception as e:
+        print(f"⚠️ fp16 embedding failed ({e}); using fp32")
+    model.float()
+
+
+# EMBED_BACKEND=onnx runs MiniLM through ONNX Runtime (much faster on CPU);
+# needs sentence-transformers[onnx]. "torch" keeps the PyTorch model.
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+
+def _configure_torch_threads():
+    """Size torch's CPU thread pools to the CPUs this process may use (NITISARA_TORCH_THREADS overrides)."""
+    try:
+        import torch
+    except ImportError:
+        return
+    available = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    threads = int(os.getenv("NITISARA_TORCH_THREADS", str(available)))
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(max(1, threads // 2))
+    except RuntimeError:
+        pass  # only settable before torch starts parallel work
+
+
+_configure_torch_threads()
+_device = _embedding_device()
+_model_kwargs = {"device": _device}
+if EMBED_BACKEND != "torch":
+    _model_kwargs["backend"] = EMBED_BACKEND
+embeddings = HuggingFaceEmbeddings(
+    model_name=EMBED_MODEL,
+    model_kwargs=_model_kwargs,
+    encode_kwargs={"batch_size": EMBED_BATCH_SIZE, "normalize_embeddings": True},
+)
+if EMBED_FP16 and EMBED_BACKEND == "torch" and _device.startswith("cuda"):
+    _use_fp16(embeddings.client)
+
+# Index type by shard size: flat scan for small shards, IVF (probed, cheap to
+# train) for mid-size ones, both storing vectors as fp16 (768 bytes per row
+# instead of 1.5 KB, near-lossless for unit vectors), and IVF-PQ (32 bytes per
+# row) once even fp16 vectors stop fitting comfortably in RAM
+IVF_MIN_ROWS = 10_000
+IVFPQ_MIN_ROWS = 1_000_000
+PQ_SUBQUANTIZERS = 32
+IVF_NPROBE = 16
+
+
+def _build_index(vectors):
+    """Inner-product index over unit vectors (= cosine), chosen by shard size."""
+    rows, dim = vectors.shape
+    if rows < IVF_MIN_ROWS:  # SQfp16 needs no training
+        index = faiss.index_factory(dim, "SQfp16", faiss.METRIC_INNER_PRODUCT)
+    else:
+        nlist = int(4 * math.sqrt(rows))
+        if rows < IVFPQ_MIN_ROWS:
+            index = faiss.index_factory(dim, f"IVF{nlist},SQfp16", faiss.METRIC_INNER_PRODUCT)
+            nprobe = max(8, nlist // 32)
+        else:
+            index = faiss.index_factory(dim, f"IVF{nlist},PQ{PQ_SUBQUANTIZERS}x8", faiss.METRIC_INNER_PRODUCT)
+            nprobe = IVF_NPROBE
+        index.train(vectors)
+        index.nprobe = nprobe  # saved with the index
+    index.add(vectors)
+    return index
+
+
+def _build_vector_store(docs):
+    """Embed the rows and wrap the index in a LangChain FAISS store (loadable with FAISS.load_local)."""
+    # Straight to the SentenceTransformer: it length-sorts rows into batches and
+    # returns one float32 array (embed_documents converts every vector to a list).
+    # Newlines become spaces, exactly as embed_documents / embed_query do, and
+    # vectors are normalized here, once, so searches are plain inner products.
+    texts = [doc.page_content.replace("\n", " ") for doc in docs]
+    # Duplicate rows are embedded once; every copy still gets its own vector and docstore entry
+    slots = {}
+    rows = np.fromiter((slots.setdefault(text, len(slots)) for text in texts), dtype=np.intp, count=len(texts))
+    unique = embeddings.client.encode(
+        list(slots), batch_size=EMBED_BATCH_SIZE, convert_to_numpy=True,
+        normalize_embeddings=True, show_progress_bar=True
+    ).astype(np.float32, copy=False)
+    vectors = unique[rows]
+    # Docstore ids are the rows' index positions: a few bytes each instead of a 36-char uuid4
+    ids = [str(i) for i in range(len(docs))]
+    return FAISS(
+        embedding_function=embeddings,
+        index=_build_index(vectors),
+        docstore=InMemoryDocstore(dict(zip(ids, docs))),
+        index_to_docstore_id=dict(enumerate(ids)),
+        distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+    )
+
+def _save_vector_store(db, db_path):
+    """
+    save_local into a temp dir, then rename the files into place. Servers
+    memory-map index.faiss, so it must be replaced, never rewritten in place.
+    """
+    tmp_path = f"{db_path}.tmp"
+    db.save_local(tmp_path)
+    os.makedirs(db_path, exist_ok=True)
+    for name in os.listdir(tmp_path):
+        os.replace(os.path.join(tmp_path, name), os.path.join(db_path, name))
+    os.rmdir(tmp_path)
 
 # ==========================================================
 # 3️⃣ Training Function
 # ==========================================================
-def train_rag_for_all():
+# Each DB records the digest of the CSV (and index settings) it was built from
+DIGEST_FILE = "source.hash"
+BUILD_SETTINGS = f"{EMBED_MODEL}|{EMBED_BACKEND}|{IVF_MIN_ROWS}|{IVFPQ_MIN_ROWS}|{PQ_SUBQUANTIZERS}|ip-sqfp16|nonempty-rows"
+
+def _db_path(filename):
+    return os.path.join(VECTOR_FOLDER, f"{filename.replace('.csv', '')}_db")
+
+
+def _dataset_digest(filepath):
+    """Hash of the CSV bytes plus the settings that shape its index."""
+    digest = hashlib.blake2b(BUILD_SETTINGS.encode("utf-8"), digest_size=16)
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _stored_digest(db_path):
+    try:
+        with open(os.path.join(db_path, DIGEST_FILE)) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def _load_dataset(filename, force=False):
+    """
+    Parse one CSV into (documents, digest). None if the file is missing, or if
+    its saved index was built from the same bytes and settings (unless forced).
+    """
+    filepath = os.path.join(DATA_FOLDER, filename)
+    if not os.path.exists(filepath):
+        print(f"⚠️ Skipping missing file: {filename}")
+        return None
+
+    digest = _dataset_digest(filepath)
+    db_path = _db_path(filename)
+    if not force and os.path.exists(os.path.join(db_path, "index.faiss")) and _stored_digest(db_path) == digest:
+        print(f"✅ Unchanged since last training, keeping {db_path}")
+        return None
+
+    print(f"\n📄 Loading dataset: {filename}")
+    # Rows come from the C csv.reader as plain lists, formatted like CSVLoader's
+    # documents, minus rows with no values and columns that are empty in every row
+    with open(filepath, newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        rows = [row for row in reader if row]  # DictReader skips blank lines too
+    keep = [j for j in range(len(header)) if any(j < len(row) and row[j].strip() for row in rows)]
+    keys = [(j, f"{header[j].strip()}: ") for j in keep]
+    docs = [
+        Document(page_content=_row_text(keys, len(header), row), metadata={"source": filepath, "row": i})
+        for i, row in enumerate(rows)
+        if any(value.strip() for value in row)
+    ]
+    return docs, digest
+
+
+def _row_text(keys, width, row):
+    """'column: value' lines for the kept columns, formatted as CSVLoader does."""
+    text = "\n".join(
+        key + (row[j].strip() if j < len(row) else "None")  # DictReader fills short rows with None
+        for j, key in keys
+    )
+    if len(row) > width:
+        text += "\nNone: " + ",".join(value.strip() for value in row[width:])
+    return text
+
+
+def train_rag_for_all(force=False):
+    """Build a FAISS DB per dataset; unchanged datasets are skipped unless `force`."""
     datasets = [
         "companies.csv",
         "contacts.csv",
@@ -43,24 +252,26 @@ def train_rag_for_all():
         "tracking.csv",
     ]
 
-    for filename in datasets:
-        filepath = os.path.join(DATA_FOLDER, filename)
-        if not os.path.exists(filepath):
-            print(f"⚠️ Skipping missing file: {filename}")
-            continue
-
-        print(f"\n📄 Loading dataset: {filename}")
-        loader = CSVLoader(file_path=filepath)
-        docs = loader.load()
+    # The next CSV is parsed on a helper thread while the current shard is embedded
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="csv-prefetch") as pool:
+        pending = pool.submit(_load_dataset, datasets[0], force)
+        for i, filename in enumerate(datasets):
+            loaded = pending.result()
+            if i + 1 < len(datasets):
+                pending = pool.submit(_load_dataset, datasets[i + 1], force)
+            if loaded is None:
+                continue
+            docs, digest = loaded
 
-        print(f"🔍 Creating FAISS index for {filename}...")
-        db = FAISS.from_documents(docs, embeddings)
+            print(f"🔍 Creating FAISS index for {filename}...")
+            db = _build_vector_store(docs)
 
-        db_name = filename.replace(".csv", "")
-        db_path = os.path.join(VECTOR_FOLDER, f"{db_name}_db")
-        db.save_local(db_path)
+            db_path = _db_path(filename)
+            _save_vector_store(db, db_path)
+            with open(os.path.join(db_path, DIGEST_FILE), "w") as f:
+                f.write(digest)
 
-        print(f"✅ Saved FAISS DB: {db_path}")
+            print(f"✅ Saved FAISS DB: {db_path}")
 
     print("\n🎯 Training complete! All datasets are now embedded and searchable.\n")
 
@@ -0,0 +1,19 @@
+"""
+WSGI entry point for gunicorn + gevent.
+
+gevent must patch sockets, threads and time before anything else is imported,
+so blocking calls to Gemini, Firebase and the RAG store yield to other
+requests instead of holding the worker:
+
+    cd backend && gunicorn wsgi:app
+
+Worker settings live in gunicorn.conf.py. Async compliance jobs are kept
+in process memory, so poll their results through the same worker (sticky
+sessions) or use the synchronous upload mode.
+"""
+
+from gevent import monkey
+
+monkey.patch_all()
+
+from main import app  # noqa: E402